@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+"""In-process Fedora stand-in for benchmarks.
+
+Implements the subset of the Fedora 6 REST API used by pyfcrepo: LDP
+containers and binaries (turtle or N-Triples), fcr:versions and memento
+negotiation (Accept-Datetime), fcr:search with pagination, fcr:tx
+transactions (Atomic-ID), SPARQL-Update PATCH, ETag/If-Match/If-None-Match
+and Digest checks. Latency, error statuses and connection resets can be
+injected.
+
+    srv = FedoraStub(latency=0.005, error_rate=0.01).start()
+    client = FedoraClient(srv.url, ('bench', 'bench'))
+    ...
+    srv.stop()
+"""
+
+import fnmatch
+import email.utils
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+PREFIXES = {
+    'rico': 'https://www.ica.org/standards/RiC/ontology#',
+    'premis': 'http://id.loc.gov/vocabulary/preservation/',
+    'ebucore': 'http://www.ebu.ch/metadata/ontologies/ebucore/ebucore#',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'ldp': 'http://www.w3.org/ns/ldp#',
+    'fedora': 'http://fedora.info/definitions/v4/repository#',
+}
+LDP_CONTAINS = '<http://www.w3.org/ns/ldp#contains>'
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+
+TERM = re.compile(r'''<[^>]*>|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[A-Za-z][\w-]*:[\w.\-/]*[\w/]|[A-Za-z][\w-]*:|[,;.]|[^\s,;.]+''')
+
+def parse_turtle(text, base):
+    """Parse the small turtle subset written by pyfcrepo into (p, o) pairs"""
+    prefixes = dict(PREFIXES)
+    triples = []
+    body = []
+    for line in text.split('\n'):
+        m = re.match(r'\s*@prefix\s+([\w-]*):\s*<([^>]*)>\s*\.', line)
+        if m:
+            prefixes[m.group(1)] = m.group(2)
+        else:
+            body.append(line)
+    tokens = TERM.findall('\n'.join(body))
+
+    def expand(t):
+        if t.startswith('<'):
+            iri = t[1:-1]
+            if iri == '':
+                return '<' + base + '>'
+            if ':' in iri and not iri.startswith('http') and iri.split(':', 1)[0] in prefixes:
+                pfx, local = iri.split(':', 1)
+                return '<' + prefixes[pfx] + local + '>'
+            return t
+        if t[0] in '"\'':
+            return '"' + t[1:-1].replace('"', '\\"') + '"'
+        if ':' in t:
+            pfx, local = t.split(':', 1)
+            if pfx in prefixes:
+                return '<' + prefixes[pfx] + local + '>'
+        if t == 'a':
+            return RDF_TYPE
+        return '"' + t + '"'
+
+    subject = predicate = None
+    state = 's'
+    for t in tokens:
+        if t == '.':
+            state = 's'
+        elif t == ';':
+            state = 'p'
+        elif t == ',':
+            state = 'o'
+        elif state == 's':
+            subject, state = expand(t), 'p'
+        elif state == 'p':
+            predicate, state = expand(t), 'o'
+        else:
+            if subject == '<' + base + '>':
+                triples.append((predicate, expand(t)))
+            state = 'o'
+    return triples
+
+def parse_sparql_update(text, base):
+    """Parse DELETE { } INSERT { } WHERE { } with concrete or variable objects"""
+    prefixes = dict(PREFIXES)
+    for m in re.finditer(r'PREFIX\s+([\w-]*):\s*<([^>]*)>', text, re.I):
+        prefixes[m.group(1)] = m.group(2)
+
+    def block(keyword):
+        m = re.search(keyword + r'(?:\s+DATA)?\s*\{(.*?)\}', text, re.I | re.S)
+        if m is None:
+            return []
+        ttl = '\n'.join('@prefix %s: <%s> .' % kv for kv in prefixes.items())
+        return parse_turtle(ttl + '\n' + m.group(1).replace('?', 'VAR_'), base)
+
+    return block('DELETE'), block('INSERT')
+
+class Resource:
+    def __init__(self):
+        self.triples = []
+        self.binary = None
+        self.ctype = 'text/turtle'
+        self.versions = []
+        self.etag = None
+        self.modified = None
+        self.archival_group = False
+
+    def touch(self, clock):
+        ts = clock()
+        self.modified = ts
+        self.etag = hashlib.md5((repr(self.triples) + repr(ts) + repr(len(self.binary or b''))).encode()).hexdigest()
+        label = time.strftime('%Y%m%d%H%M%S', time.gmtime(ts))
+        while any(v[0] >= label for v in self.versions):
+            label = str(int(max(v[0] for v in self.versions)) + 1)
+        self.versions.append((label, list(self.triples), ts))
+
+class FedoraStub(ThreadingHTTPServer):
+    """Threaded HTTP server holding the repository state in memory"""
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, error_rate=0.0, error_status=503,
+                 reset_rate=0.0, seed=0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reset_rate = reset_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.resources = {}
+        self.transactions = {}
+        self.tx_counter = itertools.count(1)
+        self.children = defaultdict(set)
+        self.generation = 0
+        self.searches = {}
+        self.requests = 0
+        self.clock = time.time
+
+    @property
+    def url(self):
+        return 'http://%s:%d/rest/' % self.server_address
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever, daemon=True)
+        t.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def add(self, path, res):
+        """Store a committed resource; callers hold the lock"""
+        if path not in self.resources:
+            parent, _, name = path.rpartition('/')
+            self.children[parent].add(path)
+        self.resources[path] = res
+        self.generation += 1
+
+    def remove(self, path):
+        if self.resources.pop(path, None) is None:
+            return False
+        self.children[path.rpartition('/')[0]].discard(path)
+        self.generation += 1
+        return True
+
+    def search(self, pattern):
+        """Sorted ids matching a fedora_id pattern, cached until the next write"""
+        key = (pattern, self.generation)
+        if key not in self.searches:
+            self.searches = {}
+            prefix = pattern.split('*')[0]
+            self.searches[key] = [self.url + p for p in sorted(self.resources)
+                                  if (self.url + p).startswith(prefix) and fnmatch.fnmatchcase(self.url + p, pattern)]
+        return self.searches[key]
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    # helpers
+
+    def send(self, status, body=b'', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            out = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return out
+                out += self.rfile.read(size)
+                self.rfile.readline()
+        n = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(n) if n else b''
+
+    def path_info(self):
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        if path.startswith('/rest/'):
+            path = path[len('/rest/'):]
+        elif path == '/rest':
+            path = ''
+        return path.strip('/'), parse_qs(parts.query)
+
+    def full(self, path):
+        return self.server.url + path
+
+    def store(self):
+        tx = self.headers.get('Atomic-ID')
+        if tx:
+            tx = tx.rstrip('/').split('/')[-1]
+            return self.server.transactions.get(tx)
+        return self.server.resources
+
+    def inject(self):
+        srv = self.server
+        srv.requests += 1
+        if srv.latency:
+            time.sleep(srv.latency)
+        with srv.lock:
+            r = srv.random.random()
+        if r < srv.reset_rate:
+            self.close_connection = True
+            self.connection.close()
+            return True
+        if r < srv.reset_rate + srv.error_rate:
+            self.read_body()
+            self.send(srv.error_status, 'injected error')
+            return True
+        return False
+
+    # rendering
+
+    def server_managed(self, s, res):
+        """Triples Fedora adds to every RDF source"""
+        fedora, ldp = PREFIXES['fedora'], PREFIXES['ldp']
+        date = '"%s"^^<http://www.w3.org/2001/XMLSchema#dateTime>' % time.strftime(
+            '%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(res.modified or 0))
+        out = [(s, '<' + fedora + p + '>', date) for p in ('created', 'lastModified')]
+        out += [(s, '<' + fedora + p + '>', '"bench"') for p in ('createdBy', 'lastModifiedBy')]
+        for t in ('fedora:Resource', 'fedora:Container', 'ldp:RDFSource', 'ldp:Container', 'ldp:BasicContainer'):
+            prefix, local = t.split(':')
+            out.append((s, RDF_TYPE, '<' + PREFIXES[prefix] + local + '>'))
+        return out
+
+    def is_server_managed(self, t):
+        return t[1].startswith('<' + PREFIXES['fedora']) or (t[1] == RDF_TYPE and (
+            t[2].startswith('<' + PREFIXES['fedora']) or t[2].startswith('<' + PREFIXES['ldp'])))
+
+    def triples_for(self, path, res, triples=None, contains=True):
+        s = '<' + self.full(path) + '>'
+        out = [(s, p, o) for p, o in (res.triples if triples is None else triples)]
+        out += self.server_managed(s, res)
+        if contains:
+            for other in sorted(self.server.children.get(path, ())):
+                out.append((s, LDP_CONTAINS, '<' + self.full(other) + '>'))
+        return out
+
+    def render(self, triples):
+        accept = self.headers.get('Accept', '')
+        prefer = self.headers.get('Prefer', '')
+        if 'ServerManaged' in prefer:
+            triples = [t for t in triples if t[1] != LDP_CONTAINS and not self.is_server_managed(t)]
+        elif 'minimal' in prefer:
+            triples = [t for t in triples if t[1] != LDP_CONTAINS]
+        if 'application/n-triples' in accept:
+            return 'application/n-triples;charset=utf-8', ''.join('%s %s %s .\n' % t for t in triples)
+        lines = ['@prefix rdf:  <%s> .' % PREFIXES['rdf'], '']
+        subject = None
+        for s, p, o in triples:
+            if s != subject:
+                if subject is not None:
+                    lines[-1] = lines[-1][:-1] + '.'
+                    lines.append('')
+                lines.append(s)
+                subject = s
+            lines.append('        %s  %s ;' % (p, o))
+        if subject is not None:
+            lines[-1] = lines[-1][:-1] + '.'
+        return 'text/turtle;charset=utf-8', '\n'.join(lines) + '\n'
+
+    def headers_for(self, res, ctype):
+        h = {'Content-Type': ctype, 'ETag': '"%s"' % res.etag,
+             'Last-Modified': email.utils.formatdate(res.modified, usegmt=True)}
+        if res.archival_group:
+            h['Link'] = '<http://fedora.info/definitions/v4/repository#ArchivalGroup>;rel="type"'
+        return h
+
+    # verbs
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if self.inject():
+            return
+        path, query = self.path_info()
+        srv = self.server
+        with srv.lock:
+            if path == 'fcr:search':
+                return self.search(query)
+            m = re.match(r'(.*)/fcr:versions(?:/(\d+))?$', path)
+            if m:
+                res = srv.resources.get(m.group(1))
+                if res is None:
+                    return self.send(404)
+                if m.group(2) is None:
+                    s = '<' + self.full(path) + '>'
+                    triples = [(s, LDP_CONTAINS, '<' + self.full(path) + '/' + v[0] + '>') for v in res.versions]
+                    ctype, body = self.render(triples)
+                    return self.send(200, body, {'Content-Type': ctype})
+                for label, triples, ts in res.versions:
+                    if label == m.group(2):
+                        ctype, body = self.render(self.triples_for(m.group(1), res, triples, contains=False))
+                        return self.send(200, body, {'Content-Type': ctype,
+                                                     'Memento-Datetime': email.utils.formatdate(ts, usegmt=True)})
+                return self.send(404)
+            if path == '':
+                return self.send(200, '', {'Content-Type': 'text/turtle'})
+            res = srv.resources.get(path)
+            if res is None:
+                return self.send(404, 'Not found')
+            accept_dt = self.headers.get('Accept-Datetime')
+            if accept_dt:
+                when = email.utils.parsedate_to_datetime(accept_dt).timestamp()
+                match = None
+                for v in res.versions:
+                    if int(v[2]) <= when:
+                        match = v
+                if match is None:
+                    return self.send(406)
+                return self.send(302, '', {'Location': self.full(path) + '/fcr:versions/' + match[0]})
+            inm = self.headers.get('If-None-Match')
+            if inm is not None and inm.strip('W/').strip('"') == res.etag:
+                return self.send(304, '', {'ETag': '"%s"' % res.etag})
+            if res.binary is not None:
+                return self.send(200, res.binary, self.headers_for(res, res.ctype))
+            ctype, body = self.render(self.triples_for(path, res))
+            return self.send(200, body, self.headers_for(res, ctype))
+
+    def search(self, query):
+        cond = query.get('condition', [''])[0]
+        m = re.match(r'fedora_id\s*=\s*(.*)', cond)
+        pattern = m.group(1) if m else '*'
+        if not pattern.startswith('http'):
+            pattern = self.server.url + pattern
+        offset = int(query.get('offset', ['0'])[0])
+        max_results = int(query.get('max_results', ['100'])[0])
+        ids = self.server.search(pattern)
+        items = [{'fedora_id': i} for i in ids[offset:offset + max_results]]
+        body = json.dumps({'pagination': {'offset': offset, 'maxResults': max_results,
+                                          'totalResults': len(ids)}, 'items': items})
+        return self.send(200, body, {'Content-Type': 'application/json'})
+
+    def do_PUT(self):
+        if self.inject():
+            return
+        path, query = self.path_info()
+        body = self.read_body()
+        srv = self.server
+        with srv.lock:
+            m = re.match(r'fcr:tx/(\w+)$', path)
+            if m:
+                tx = srv.transactions.pop(m.group(1), None)
+                if tx is None:
+                    return self.send(404)
+                for p, res in tx.items():
+                    srv.add(p, res)
+                return self.send(204)
+            store = self.store()
+            if store is None:
+                return self.send(409, 'unknown transaction')
+            res = store.get(path) or srv.resources.get(path)
+            im = self.headers.get('If-Match')
+            if im is not None and (res is None or im.strip('"') != res.etag):
+                return self.send(412, 'precondition failed')
+            new = Resource()
+            if res is not None:
+                new.versions = list(res.versions)
+                new.archival_group = res.archival_group
+            ctype = self.headers.get('Content-Type', 'text/turtle')
+            link = self.headers.get('Link', '')
+            if 'NonRDFSource' in link or not ctype.startswith('text/turtle'):
+                digest = self.headers.get('Digest')
+                if digest:
+                    algo, value = digest.split('=', 1)
+                    h = hashlib.new({'sha-256': 'sha256', 'sha-512': 'sha512', 'sha': 'sha1'}[algo.lower()])
+                    h.update(body)
+                    if h.hexdigest() != value:
+                        return self.send(409, 'digest mismatch')
+                new.binary = body
+                new.ctype = ctype
+            else:
+                new.triples = parse_turtle(body.decode('utf-8'), self.full(path))
+            new.archival_group = new.archival_group or 'ArchivalGroup' in link
+            new.touch(srv.clock)
+            if store is srv.resources:
+                srv.add(path, new)
+            else:
+                store[path] = new
+            return self.send(204 if res is not None else 201, '', {'ETag': '"%s"' % new.etag})
+
+    def do_PATCH(self):
+        if self.inject():
+            return
+        path, query = self.path_info()
+        body = self.read_body().decode('utf-8')
+        srv = self.server
+        with srv.lock:
+            store = self.store()
+            res = store.get(path) or srv.resources.get(path)
+            if res is None:
+                return self.send(404)
+            im = self.headers.get('If-Match')
+            if im is not None and im.strip('"') != res.etag:
+                return self.send(412, 'precondition failed')
+            deletes, inserts = parse_sparql_update(body, self.full(path))
+            triples = list(res.triples)
+            for p, o in deletes:
+                if o.startswith('<VAR_') or o.startswith('"VAR_') or o.startswith('VAR_'):
+                    triples = [t for t in triples if t[0] != p]
+                else:
+                    triples = [t for t in triples if t != (p, o)]
+            triples += inserts
+            new = Resource()
+            new.triples = triples
+            new.versions = list(res.versions)
+            new.archival_group = res.archival_group
+            new.touch(srv.clock)
+            if store is srv.resources:
+                srv.add(path, new)
+            else:
+                store[path] = new
+            return self.send(204, '', {'ETag': '"%s"' % new.etag})
+
+    def do_POST(self):
+        if self.inject():
+            return
+        path, query = self.path_info()
+        self.read_body()
+        srv = self.server
+        with srv.lock:
+            if path == 'fcr:tx':
+                tx = str(next(srv.tx_counter))
+                srv.transactions[tx] = {}
+                return self.send(201, '', {'Location': self.full('fcr:tx/' + tx)})
+            m = re.match(r'fcr:tx/(\w+)$', path)
+            if m:
+                return self.send(204 if m.group(1) in srv.transactions else 404)
+            return self.send(405)
+
+    def do_DELETE(self):
+        if self.inject():
+            return
+        path, query = self.path_info()
+        srv = self.server
+        with srv.lock:
+            m = re.match(r'fcr:tx/(\w+)$', path)
+            if m:
+                return self.send(204 if srv.transactions.pop(m.group(1), None) is not None else 404)
+            if not srv.remove(path):
+                return self.send(404)
+            return self.send(204)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+"""Synthetic fixtures: referentials (M1..M44 layout), EdV agents and records manifests.
+
+python -m benchmarks.generate --scale 1k|100k|1m --out bench-data
+"""
+
+import os
+import argparse
+import random
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+SAMPLE_REF = os.path.join(DATA, 'referentials', 'acv2.0.0.csv')
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+AGENTS_HEADER = 'Code;Acronyme;Nom;Code autorité;Code département;Code unité;PARENT'
+RECORDS_HEADER = ('id;type;callnr;parent;instance;title;description;fmtName;fmtVersion;fmtRegistryName;fmt;'
+                  'ceatingApp;creatinAppVersion;envName;envVersion;mimetype;filename')
+
+def parent_of(i):
+    """Nodes hang under a parent ten times closer to the root"""
+    return 0 if i < 10 else i // 10
+
+def leaves(n):
+    """Ids of the leaf nodes of a referential of n nodes"""
+    return [i for i in range(1, n) if 10 * i >= n]
+
+def referential(n, filename, sample=SAMPLE_REF):
+    """Referential of n nodes with the full ACV column layout, rows cycled from sample"""
+    with open(sample, encoding='utf-8-sig') as f:
+        lines = f.read().splitlines()
+    header, rows = lines[0], [l.split(';', 2) for l in lines[2:] if l != '']
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(header + '\n')
+        f.write(lines[1] + '\n')
+        for i in range(1, n):
+            f.write('{i};{p};{rest}\n'.format(i=i, p=parent_of(i), rest=rows[i % len(rows)][2]))
+
+def referential_update(filename, filename_new, rate=0.01, seed=0):
+    """Next version of a referential: about rate of the nodes renamed, moved, deleted and created"""
+    rnd = random.Random(seed)
+    with open(filename, encoding='utf-8-sig') as f:
+        lines = f.read().splitlines()
+    header, root, rows = lines[0], lines[1], [l.split(';') for l in lines[2:] if l != '']
+    parents = set(r[1] for r in rows)
+    out = []
+    for r in rows:
+        x = rnd.random()
+        if x < rate and r[0] not in parents:
+            continue
+        elif x < 2 * rate:
+            r[2] = '="{cote}"'.format(cote='N.' + r[0])
+            r[3] = '="Renamed {i}"'.format(i=r[0])
+        elif x < 3 * rate:
+            r[1] = '0'
+        out.append(r)
+    n = max(int(r[0]) for r in rows) + 1
+    for i in range(n, n + int(rate * len(rows))):
+        new = list(rows[i % len(rows)])
+        new[0], new[1] = str(i), rnd.choice(out)[0]
+        out.append(new)
+    with open(filename_new, 'w', encoding='utf-8') as f:
+        f.write(header + '\n')
+        f.write(root + '\n')
+        for r in out:
+            f.write(';'.join(r) + '\n')
+
+def agents(n, filename):
+    """EdV-style administrative units tree of n agents under the EDV root"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(AGENTS_HEADER + '\n')
+        for i in range(1, n):
+            parent = 'EDV' if i < 10 else 'A' + str(i // 10)
+            f.write('A{i};U{i};Unité administrative {i};;;;{p}\n'.format(i=i, p=parent))
+        f.write('EDV;EDV;"État de Vaud";;;;-\n')
+
+def files(directory, n=8, size=4096, seed=0):
+    """n binary files of size bytes, shared by the documents of a manifest"""
+    rnd = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    out = []
+    for k in range(n):
+        filename = os.path.join(directory, 'file{k}.pdf'.format(k=k))
+        with open(filename, 'wb') as f:
+            f.write(bytes(rnd.getrandbits(8) for _ in range(size)))
+        out.append(filename)
+    return out
+
+def records(n, filename, refids, filenames, docs_per_dossier=9):
+    """Records manifest of n rows, sorted by dossier, dossiers attached to refids in turn"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(RECORDS_HEADER + '\n')
+        for i in range(n):
+            d, k = divmod(i, docs_per_dossier + 1)
+            did = 'D{:09d}'.format(d)
+            if k == 0:
+                f.write('{did};dossier;B.{d};referential/{ref};;Dossier {d};Dossier de test {d}.;;;;;;;;;;\n'.format(
+                    did=did, d=d, ref=refids[d % len(refids)]))
+            else:
+                f.write(('{did};document;{k};;I1;Document {k};Document {k} du dossier {d}.;PDF/A1;1.4;PRONOM;fmt/95;'
+                         'LibreOffice;7.3.1;Ubuntu;22.04;application/pdf;{filename}\n').format(
+                    did=did, k=k, d=d, filename=filenames[i % len(filenames)]))
+
+def fixtures(n, directory):
+    """All fixtures of one scale in directory, returns their file names"""
+    os.makedirs(directory, exist_ok=True)
+    out = {'ref': os.path.join(directory, 'ref1.csv'),
+           'ref_new': os.path.join(directory, 'ref2.csv'),
+           'agents': os.path.join(directory, 'agents.csv'),
+           'records': os.path.join(directory, 'records.csv'),
+           'n': n}
+    referential(n, out['ref'])
+    referential_update(out['ref'], out['ref_new'])
+    agents(n, out['agents'])
+    records(n, out['records'], leaves(n), files(os.path.join(directory, 'files')))
+    out['refid'] = leaves(n)[0]
+    return out
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', choices=list(SCALES), default='1k')
+    parser.add_argument('--out', default='bench-data')
+    args = parser.parse_args()
+    print(fixtures(SCALES[args.scale], args.out))
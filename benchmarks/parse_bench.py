@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+"""Node parsing: line-substring turtle scan vs. N-Triples parser.
+
+python -m benchmarks.parse_bench [--children 1000 10000 100000]
+"""
+
+import argparse
+import timeit
+
+from pyfcrepo import rdf
+from pyfcrepo import referential
+
+URL = 'http://localhost:8080/rest/records/acv/referential/3'
+
+def synthetic_node(n_children, n_contains):
+    """Turtle (Fedora layout) and N-Triples of one container with many children"""
+    triples = [
+        (rdf.RICO + 'title', '"Direction"'),
+        (rdf.RICO + 'hasOrHadIdentifier', '"D"'),
+        (rdf.PREMIS + 'version', '"2.0.0"'),
+        (rdf.RICO + 'isOrWasPartOf', '<http://localhost:8080/rest/records/acv/referential/0>'),
+        (rdf.RICO + 'scopeAndContent', '"Texte libre"'),
+    ]
+    triples += [(rdf.RICO + 'hasOrHadPart', '<' + URL + '/' + str(i) + '>') for i in range(n_children)]
+    triples += [(rdf.LDP + 'contains', '<' + URL + '/c' + str(i) + '>') for i in range(n_contains)]
+    turtle = '<' + URL + '>\n' + ''.join('        <%s>  %s ;\n' % t for t in triples)
+    ntriples = ''.join('<%s> <%s> %s .\n' % (URL, p, o) for p, o in triples)
+    return turtle, ntriples
+
+def run(sizes, repeat=5):
+    print('{:>10} {:>12} {:>12} {:>8}'.format('children', 'turtle (ms)', 'ntriples(ms)', 'speedup'))
+    for n in sizes:
+        turtle, ntriples = synthetic_node(n, n)
+        assert len(referential.parse_node(turtle, URL)['children']) == n
+        assert len(rdf.node_record(ntriples, URL)['children']) == n
+        t1 = min(timeit.repeat(lambda: referential.parse_node(turtle, URL), number=1, repeat=repeat))
+        t2 = min(timeit.repeat(lambda: rdf.node_record(ntriples, URL), number=1, repeat=repeat))
+        print('{:>10} {:>12.2f} {:>12.2f} {:>8.2f}'.format(n, t1*1000, t2*1000, t1/t2))
+
+def check_comma_separated(n=100):
+    """Fedora writes multi-valued predicates as `<p> <o1> , <o2> ;` in turtle"""
+    children = ' , '.join('<' + URL + '/' + str(i) + '>' for i in range(n))
+    turtle = '<' + URL + '>\n        <' + rdf.RICO + 'hasOrHadPart>  ' + children + ' .\n'
+    ntriples = ''.join('<%s> <%s> <%s/%d> .\n' % (URL, rdf.RICO + 'hasOrHadPart', URL, i) for i in range(n))
+    print('comma-separated objects: turtle scan finds {a} of {n} children, N-Triples parser {b}'.format(
+        a=len(referential.parse_node(turtle, URL)['children']), n=n,
+        b=len(rdf.node_record(ntriples, URL)['children'])))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--children', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    run(args.children)
+    check_comma_separated()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+"""Load preparation: per-dossier filtering and iterrows vs. one grouped pass.
+
+python -m benchmarks.prepare_bench [--rows 1000 10000 100000 1000000] [--legacy-max 20000]
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+from pyfcrepo import records
+from pyfcrepo import referential
+
+COLUMNS = ['id', 'type', 'callnr', 'parent', 'instance', 'title', 'description', 'mimetype', 'filename']
+
+def synthetic_manifest(n, docs_per_dossier=9):
+    """Records manifest of n rows: dossiers followed by their documents"""
+    rows = []
+    for i in range(n):
+        d, k = divmod(i, docs_per_dossier + 1)
+        did = 'D{:09d}'.format(d)
+        if k == 0:
+            rows.append((did, 'dossier', 'M.06.02', 'referential/19135', 'nan', 'Dossier ' + did,
+                         'Dossier description.', 'nan', 'nan'))
+        else:
+            rows.append((did, 'document', str(k), 'nan', 'I1', 'Document ' + str(k),
+                         'Document description.', 'application/pdf', 'data/records/files/file.pdf'))
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+def synthetic_tree(n):
+    ids = list(range(n))
+    return pd.DataFrame({'id': ids, 'parent_id': ['-'] + [str(i // 10) for i in ids[1:]]})
+
+def prepare_legacy(df):
+    n = 0
+    for d in pd.unique(df['id']):
+        dossier = df[df['id'] == d]
+        docs = dossier[dossier['type'] == 'document']
+        for ix, doc in docs.iterrows():
+            n += 1
+    return n
+
+def prepare(df):
+    n = 0
+    for dossier in records.group_dossiers(df):
+        docs = [row for row in dossier if row.type == 'document']
+        for doc in docs:
+            n += 1
+    return n
+
+def tree_legacy(df):
+    children = defaultdict(list)
+    parents = defaultdict(list)
+    for ix, row in df.iterrows():
+        if row['parent_id'] != '-':
+            children[int(row['parent_id'])].append(int(row['id']))
+            parents[int(row['id'])].append(int(row['parent_id']))
+    return children, parents
+
+def timed(f, *args):
+    t = time.perf_counter()
+    out = f(*args)
+    return time.perf_counter() - t, out
+
+def run(sizes, legacy_max):
+    print('{:>8} {:>20} {:>20} {:>20} {:>20}'.format(
+        'rows', 'manifest legacy (s)', 'manifest grouped (s)', 'tree iterrows (s)', 'tree one pass (s)'))
+    for n in sizes:
+        df = synthetic_manifest(n)
+        tree = synthetic_tree(n)
+        t2, docs = timed(prepare, df)
+        t4, maps = timed(referential.ref_tree, tree)
+        if n <= legacy_max:
+            t1, docs1 = timed(prepare_legacy, df)
+            t3, maps1 = timed(tree_legacy, tree)
+            assert docs1 == docs and maps1 == maps
+            legacy = ('{:>20.2f}'.format(t1), '{:>20.2f}'.format(t3))
+        else:
+            legacy = ('{:>20}'.format('-'), '{:>20}'.format('-'))
+        print('{:>8} {} {:>20.2f} {} {:>20.2f}'.format(n, legacy[0], t2, legacy[1], t4))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--legacy-max', type=int, default=20000,
+                        help='Largest size run with the quadratic legacy preparation.')
+    args = parser.parse_args()
+    run(args.rows, args.legacy_max)
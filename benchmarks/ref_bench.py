@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+"""Referential CSV parsing: full read + row-wise strip vs. read_ref.
+
+python -m benchmarks.ref_bench [--rows 10000 100000]
+"""
+
+import os
+import argparse
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+
+from pyfcrepo import referential
+
+from .generate import referential as synthetic_ref
+
+def read_ref_legacy(filename):
+    with warnings.catch_warnings():
+        # mixed-type columns, parsed in chunks
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        df = pd.read_csv(filename, sep=";")
+    df['id'] = df['M1']
+    df['parent_id'] = df['M2']
+    for c, m in [('cote', 'M3'), ('title', 'M4'), ('abstract', 'M5'), ('personalData', 'M13_ExternalId'),
+                 ('protection', 'M11_ExternalId'), ('closingPeriod', 'M18.1_ExternalId'),
+                 ('retentionPeriod', 'M22')]:
+        df[c] = df[m].apply(referential.strip_textfield).astype(str)
+    return df
+
+def measure(read, filename):
+    tracemalloc.start()
+    t = time.perf_counter()
+    df = read(filename)
+    t = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return t, peak, df.memory_usage(deep=True).sum()
+
+def run(sizes):
+    print('{:>8} {:>14} {:>14} {:>16} {:>16} {:>12} {:>12}'.format(
+        'rows', 'legacy (s)', 'read_ref (s)', 'legacy peak MB', 'read_ref peak MB', 'legacy MB', 'read_ref MB'))
+    with tempfile.TemporaryDirectory() as d:
+        for n in sizes:
+            filename = os.path.join(d, 'ref.csv')
+            synthetic_ref(n, filename)
+            t1, p1, m1 = measure(read_ref_legacy, filename)
+            t2, p2, m2 = measure(referential.read_ref, filename)
+            print('{:>8} {:>14.2f} {:>14.2f} {:>16.1f} {:>16.1f} {:>12.1f} {:>12.1f}'.format(
+                n, t1, t2, p1/2**20, p2/2**20, m1/2**20, m2/2**20))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+    run(args.rows)
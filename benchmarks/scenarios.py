@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+"""cli.py actions timed against the in-process Fedora stand-in.
+
+python -m benchmarks.scenarios [--scale 1k] [--workers 8] [--latency 0.002] [--only loadref updateref]
+
+Scenarios run in order on one repository (initrepo, loadagents, loadref,
+updateref, loadrecords, dumpref, listrecords). Peak RSS is measured per
+scenario where /proc/self/clear_refs allows resetting it, and includes the
+stand-in's repository state.
+"""
+
+import os
+import io
+import json
+import time
+import argparse
+import resource
+import tempfile
+import contextlib
+
+from pyfcrepo.client import FedoraClient
+from pyfcrepo import repo
+from pyfcrepo import agents
+from pyfcrepo import referential
+from pyfcrepo import records
+
+from .fedora_stub import FedoraStub
+from . import generate
+
+UNIT = 'BEN'
+
+def initrepo(fedoraUrl, client, fx, args):
+    status_codes = []
+    status_codes += repo.init_records(fedoraUrl=fedoraUrl, client=client)
+    status_codes += repo.init_types(fedoraUrl=fedoraUrl, client=client)
+    status_codes += repo.init_states(fedoraUrl=fedoraUrl, client=client)
+    status_codes += repo.init_rules(fedoraUrl=fedoraUrl, client=client)
+    status_codes.append( agents.create_root(fedoraUrl=fedoraUrl, client=client) )
+    return status_codes
+
+def loadagents(fedoraUrl, client, fx, args):
+    return agents.load_tree(fedoraUrl, client, fx['agents'])
+
+def loadref(fedoraUrl, client, fx, args):
+    return referential.load_ref(fedoraUrl, client, UNIT, 'Benchmark unit', '1.0.0', fx['ref'],
+                                workers=args.workers)
+
+def updateref(fedoraUrl, client, fx, args):
+    return referential.update_ref(fedoraUrl, client, UNIT, '2.0.0', fx['ref_new'], fx['ref'])
+
+def loadrecords(fedoraUrl, client, fx, args):
+    return records.load_records(fedoraUrl, client, UNIT, filename=fx['records'], workers=args.workers,
+                                stream=True)
+
+def dumpref(fedoraUrl, client, fx, args):
+    referential.dump_ref(fedoraUrl, client, UNIT, '2.0.0', os.path.join(fx['dir'], 'dump.html'),
+                         workers=args.workers)
+
+def listrecords(fedoraUrl, client, fx, args):
+    referential.list_records(fedoraUrl, client, UNIT, fx['refid'], refresh=True, workers=args.workers)
+
+SCENARIOS = [initrepo, loadagents, loadref, updateref, loadrecords, dumpref, listrecords]
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def peak_rss():
+    """Peak resident set size in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run(fx, args):
+    srv = FedoraStub(latency=args.latency, error_rate=args.error_rate).start()
+    client = FedoraClient(srv.url, ('bench', 'bench'), pool_size=max(10, args.workers),
+                          state_dir=os.path.join(fx['dir'], 'state'), cache=not args.no_cache)
+    results = []
+    try:
+        for scenario in SCENARIOS:
+            if args.only and scenario.__name__ not in args.only:
+                continue
+            reset_peak_rss()
+            n = srv.requests
+            t = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                out = scenario(client.fedoraUrl, client, fx, args)
+            wall = time.perf_counter() - t
+            requests = srv.requests - n
+            errors = len([c for c in (out or []) if isinstance(c, int) and c >= 400])
+            results.append({'scenario': scenario.__name__, 'wall_s': round(wall, 3), 'requests': requests,
+                            'req_per_s': round(requests / wall, 1) if wall > 0 else None,
+                            'errors': errors, 'peak_rss_mb': round(peak_rss(), 1)})
+    finally:
+        client.close()
+        srv.stop()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', choices=list(generate.SCALES), default='1k')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='Stand-in latency per request (s).')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503.')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--only', nargs='+', choices=[s.__name__ for s in SCENARIOS])
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        fx = generate.fixtures(generate.SCALES[args.scale], d)
+        fx['dir'] = d
+        results = run(fx, args)
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        print('{:<12} {:>10} {:>10} {:>10} {:>8} {:>12}'.format('scenario', 'wall (s)', 'requests', 'req/s',
+                                                               'errors', 'peak RSS MB'))
+        for r in results:
+            print('{scenario:<12} {wall_s:>10} {requests:>10} {req_per_s:>10} {errors:>8} {peak_rss_mb:>12}'.format(**r))
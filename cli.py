@@ -14,17 +14,18 @@ import os
 import pprint
 import configparser
 import argparse
-from collections import defaultdict
+from collections import defaultdict, Counter
 import datetime
 import time
 import re
 
-import requests
-
 from pyfcrepo import repo
 from pyfcrepo import agents
 from pyfcrepo import referential
 from pyfcrepo import records
+from pyfcrepo import diff
+from pyfcrepo.client import FedoraClient
+from pyfcrepo.metrics import Profiler
 
 pp = pprint.PrettyPrinter(depth=6)
 
@@ -40,6 +41,24 @@ parser.add_argument('--unitDesc', dest='unitDesc', help='Target unit description
 parser.add_argument('--file', dest='input_file', help='Input file.')
 parser.add_argument('--oldfile', dest='oldfile', help='Input file.')
 parser.add_argument('--version', dest='version', help='Version of refernetial')
+parser.add_argument('--workers', dest='workers', type=int, default=1, help='Number of concurrent requests.')
+parser.add_argument('--sync', dest='sync', action='store_true', help='Only write new or changed resources.')
+parser.add_argument('--verify', dest='verify', action='store_true', help='With --sync, also compare the ETag of unchanged resources with the server (one HEAD each).')
+parser.add_argument('--dry-run', dest='dry_run', action='store_true', help='Only report the changes updateref would make.')
+parser.add_argument('--plan', dest='plan', help='Write the updateref change plan (JSON) to this file; closerecords and moverecords read it.')
+parser.add_argument('--format', dest='format', choices=['html', 'json', 'ndjson', 'csv'], default='html', help='dumpref output format.')
+parser.add_argument('--report', dest='report', help='Write the per dossier results of closerecords or moverecords to this file.')
+parser.add_argument('--no-cache', dest='no_cache', action='store_true', help='Do not use the local metadata cache.')
+parser.add_argument('--transactions', dest='transactions', action='store_true', help='Load each dossier batch in one atomic transaction.')
+parser.add_argument('--dossiers-per-tx', dest='dossiers_per_tx', type=int, default=1, help='Number of dossiers committed per transaction.')
+parser.add_argument('--stream', dest='stream', action='store_true', help='Read the records manifest (sorted by dossier) in chunks.')
+parser.add_argument('--refresh', dest='refresh', action='store_true', help='Rebuild the local dossier index before listrecords.')
+parser.add_argument('--metrics', dest='metrics', choices=['json', 'prometheus'], help='Print request metrics at the end of the action.')
+parser.add_argument('--metrics-file', dest='metrics_file', help='Write the request metrics to this file instead.')
+parser.add_argument('--profile', dest='profile', help='Write cProfile, tracemalloc and metrics reports into this directory.')
+parser.add_argument('--max-rate', dest='max_rate', type=float, help='Max. requests per second sent to Fedora.')
+parser.add_argument('--resume', dest='resume', action='store_true', help='Skip the writes journaled by an interrupted loadref or loadrecords.')
+parser.add_argument('--max-inflight', dest='max_inflight', type=int, default=256, help='Max. MB of binaries uploaded at once.')
 
 args = parser.parse_args()
 
@@ -49,85 +68,137 @@ cfg.read('config.ini')
 cfg_set = 'DEFAULT'
 
 # fcrepo access
-protocol = cfg[cfg_set]['protocol']
-host = cfg[cfg_set]['host']
-port = cfg[cfg_set]['port']
-user = cfg[cfg_set]['user']
-pwd = cfg[cfg_set]['pwd']
-fedoraUrl = protocol + '://' + host + ':' + port + '/rest/' 
-auth = (user, pwd)
+client = FedoraClient.from_config(cfg, cfg_set, min_pool_size=args.workers,
+                                  cache=not args.no_cache, max_rate=args.max_rate)
+fedoraUrl = client.fedoraUrl
+
+profiler = None
+if args.profile is not None:
+    profiler = Profiler(args.profile)
+    profiler.start()
 
 if args.action=='checkcon':
-    r = requests.get(fedoraUrl, auth=auth)
+    r = client.head(fedoraUrl)
     print(r.status_code)
    
 elif args.action=='initrepo':
     print('Init repository ...') 
-    status_codes = repo.init_records(fedoraUrl=fedoraUrl, auth=auth)
+    status_codes = repo.init_records(fedoraUrl=fedoraUrl, client=client)
     print('Init records', status_codes)      
-    status_codes = repo.init_types(fedoraUrl=fedoraUrl, auth=auth)
+    status_codes = repo.init_types(fedoraUrl=fedoraUrl, client=client)
     print('Init record types', status_codes)   
-    status_codes = repo.init_states(fedoraUrl=fedoraUrl, auth=auth)
+    status_codes = repo.init_states(fedoraUrl=fedoraUrl, client=client)
     print('Init record states', status_codes)
-    status_codes = repo.init_rules(fedoraUrl=fedoraUrl, auth=auth)
+    status_codes = repo.init_rules(fedoraUrl=fedoraUrl, client=client)
     print('Init record mangement rules', status_codes)   
-    status_codes = agents.create_root(fedoraUrl=fedoraUrl, auth=auth)
+    status_codes = agents.create_root(fedoraUrl=fedoraUrl, client=client)
     print('Init agents root', status_codes)
  
 elif args.action=='loadagents':
     print('Load agents from {input_file}...'.format(input_file=args.input_file))
-    status_codes = agents.load_tree(fedoraUrl=fedoraUrl, auth=auth, filename=args.input_file)
+    status_codes = agents.load_tree(fedoraUrl=fedoraUrl, client=client, filename=args.input_file,
+                                    sync=args.sync, verify=args.verify)
     print('Init record types', status_codes)
 
 elif args.action=='loadref':
     print('Load preservation referential version ' + args.version)
-    status_codes = referential.load_ref(fedoraUrl=fedoraUrl, auth=auth, 
+    status_codes = referential.load_ref(fedoraUrl=fedoraUrl, client=client, 
                                 unit=args.unitCode,  unitDesc=args.unitDesc,
-                                version=args.version, filename=args.input_file)
+                                version=args.version, filename=args.input_file,
+                                workers=args.workers, sync=args.sync, resume=args.resume,
+                                verify=args.verify)
     print('Units', status_codes)
 
 elif args.action=='loadrecords':
     print('Load records...')
-    status_codes = records.load_records(fedoraUrl=fedoraUrl, auth=auth, 
-                                unit=args.unitCode)
+    status_codes = records.load_records(fedoraUrl=fedoraUrl, client=client, 
+                                unit=args.unitCode, filename=args.input_file,
+                                workers=args.workers,
+                                max_inflight_bytes=args.max_inflight*2**20,
+                                transactions=args.transactions,
+                                dossiers_per_tx=args.dossiers_per_tx,
+                                stream=args.stream, resume=args.resume)
     print('Dossier', status_codes)
 
 elif args.action=='listrecords':
     print('Dossiers attached to {unit}/referential/{id}'.format(unit=args.unitCode.lower(), id=args.refid))
-    out = referential.list_records(fedoraUrl=fedoraUrl, auth=auth, 
-                                unit=args.unitCode, refid=args.refid)
+    out = referential.list_records(fedoraUrl=fedoraUrl, client=client, 
+                                unit=args.unitCode, refid=args.refid,
+                                refresh=args.refresh, workers=args.workers)
     print(out)
 
 elif args.action=='closerecord':
     print('Close record...')
-    out = referential.close_record(fedoraUrl=fedoraUrl, auth=auth, 
+    out = referential.close_record(fedoraUrl=fedoraUrl, client=client, 
                                 unit=args.unitCode, refid=args.dosid)
     print('Dossier', out)
 
 elif args.action=='moverecord':
     print('Move record...')
-    out = referential.move_record(fedoraUrl=fedoraUrl, auth=auth, 
+    out = referential.move_record(fedoraUrl=fedoraUrl, client=client, 
                                 unit=args.unitCode, id=args.dosid, target_refid=args.refid)
     print('Dossier', out)
     
+elif args.action=='closerecords':
+    print('Close records...')
+    if args.plan is not None:
+        # dossiers attached to the referential nodes deleted by updateref
+        dossiers = referential.plan_dossier_list(fedoraUrl, client, args.unitCode, args.plan, diff.DELETED)
+    else:
+        dossiers = referential.read_dossier_list(args.input_file)
+    results = referential.close_records(fedoraUrl=fedoraUrl, client=client,
+                                unit=args.unitCode, dossiers=dossiers, workers=args.workers)
+    referential.write_results(results, args.report)
+    print('Dossiers', dict(Counter(x['status'] for x in results)))
+
+elif args.action=='moverecords':
+    print('Move records...')
+    if args.plan is not None:
+        # dossiers attached to renamed referential nodes get their new call number
+        dossiers = referential.plan_dossier_list(fedoraUrl, client, args.unitCode, args.plan, diff.RENAMED)
+    else:
+        dossiers = referential.read_dossier_list(args.input_file)
+    results = referential.move_records(fedoraUrl=fedoraUrl, client=client,
+                                unit=args.unitCode, dossiers=dossiers, workers=args.workers)
+    referential.write_results(results, args.report)
+    print('Dossiers', dict(Counter(x['status'] for x in results)))
+
 elif args.action=='updateref':
     print('Update referetial to version ' + args.version)
-    status_codes = referential.update_ref(fedoraUrl=fedoraUrl, auth=auth, 
+    status_codes = referential.update_ref(fedoraUrl=fedoraUrl, client=client, 
                                 unit=args.unitCode,
                                 version=args.version,
-                                filename=args.input_file, filename_old=args.oldfile)
+                                filename=args.input_file, filename_old=args.oldfile,
+                                sync=args.sync, dry_run=args.dry_run, plan=args.plan,
+                                verify=args.verify)
     print('Update statuses', status_codes)
 
+elif args.action=='indexversions':
+    print('Rebuild version index...')
+    index = referential.rebuild_version_index(fedoraUrl=fedoraUrl, client=client, 
+                                unit=args.unitCode)
+    print('Versions', index)
+
 elif args.action=='dumpref':
-    print('Dump referetial...')
-    status_codes = referential.dump_ref(fedoraUrl=fedoraUrl, auth=auth, 
+    # with --file -, stdout only carries the export
+    if args.input_file != '-':
+        print('Dump referetial...')
+    referential.dump_ref(fedoraUrl=fedoraUrl, client=client,
                                 unit=args.unitCode,
                                 version=args.version,
-                                filename=args.input_file)
-    print('Dumped referential into file', args.input_file)
+                                filename=args.input_file,
+                                workers=args.workers,
+                                fmt=args.format)
+    if args.input_file != '-':
+        print('Dumped referential into file', args.input_file)
     
 else:
     print(usage)
 
+if profiler is not None:
+    profiler.stop(metrics=client.metrics)
+    print('Profile written into', args.profile)
+if args.metrics is not None or args.metrics_file is not None:
+    client.metrics.write(args.metrics or 'json', args.metrics_file)
 
-        
+client.close()
@@ -11,11 +11,11 @@
 # First release: 2022-03-03
 
 import pandas as pd
-import requests
 from collections import defaultdict
 from . import nodes
+from .sync import open_sync
 
-def create_root(fedoraUrl, auth):
+def create_root(fedoraUrl, client):
 
     url = fedoraUrl + 'agents' #unitCode.lower()
     headers = {"Content-Type": "text/turtle"}
@@ -24,14 +24,14 @@ def create_root(fedoraUrl, auth):
                <>  rico:scopeAndContent   'Administrative units, groups, people and software'.
                <>  rico:hasOrHadPart <{childrenStr}>.
                """.format( childrenStr= url +'/EDV' )
-    r = requests.put(url, auth=auth, data=data.encode('utf-8'), headers=headers)
+    r = client.put(url, data=data.encode('utf-8'), headers=headers)
     return r.status_code
 
 
 def id2codeA(i, nodeType='r'):
     return 'agents/roche/' + str(i)
     
-def load_tree(fedoraUrl, auth, filename):
+def load_tree(fedoraUrl, client, filename, sync=False, verify=False):
     
     status_codes = []
     
@@ -41,7 +41,7 @@ def load_tree(fedoraUrl, auth, filename):
     description = 'Referential of Administrative units.'
     childrenStr = url + '/EDV'
     status_codes.append( nodes.create_basic(url, 
-                                            auth, 
+                                            client, 
                                             title, 
                                             description, 
                                             children=childrenStr,
@@ -58,19 +58,20 @@ def load_tree(fedoraUrl, auth, filename):
 
     children = defaultdict(list)
     parents  = defaultdict(list)
-    for ix, row in df.iterrows():
-        if row['parent_id'] != '-':
-            children[row['parent_id']].append(row['id'])
-            parents[row['id']].append(row['parent_id'])
+    for i, p in zip(df['id'].tolist(), df['parent_id'].tolist()):
+        if p != '-':
+            children[p].append(i)
+            parents[i].append(p)
 
-    # Write tree to Fedora
+    # Write tree to Fedora, with sync only new or changed agents
 
-    for ix, row in df.iterrows():
+    state = open_sync(client, sync, verify=verify)
+    for row in df[['id', 'cote', 'title']].itertuples(index=False):
         
-        url = fedoraUrl + id2codeA(row['id'] )
+        url = fedoraUrl + id2codeA(row.id )
         
         # compute parent node
-        p_nodes = parents[row['id']]
+        p_nodes = parents[row.id]
         if len(p_nodes) >= 1:
             if str(p_nodes[0]) != "-":
                 node_parent = '<' + fedoraUrl + id2codeA(p_nodes[0]) + '>'
@@ -81,7 +82,7 @@ def load_tree(fedoraUrl, auth, filename):
             node_parent = '<' + fedoraUrl + 'agents' + '>'
         
         # compute children node
-        node_children = [ '<'+fedoraUrl+id2codeA(i)+'>' for i in children[row['id']] ]
+        node_children = [ '<'+fedoraUrl+id2codeA(i)+'>' for i in children[row.id] ]
         children_str = ', '.join(node_children)
         if not children_str == '':
             parts = '<>  <rico:hasOrHadPart> ' + children_str + ' .' 
@@ -96,17 +97,23 @@ def load_tree(fedoraUrl, auth, filename):
                    <>  <rico:isOrWasPartOf> {parent}.
                    <>  <premis:version> '{archivalVersion}'.
                    {parts}
-               """.format( title=row['title'].replace("'", "\\'"),  
+               """.format( title=row.title.replace("'", "\\'"),  
                            parent=node_parent,
                            parts=parts,
                            state='http://localhost:8080/rest/states/open',
-                           identifier=row['cote'].replace('\n',''),
+                           identifier=row.cote.replace('\n',''),
                            archivalVersion='1.0.0')
         
         # send request to api
-        r = requests.put(url, auth=auth, data=data.encode('utf-8'), headers=headers)
+        if state is not None and not state.changed(url, data):
+            continue
+        r = client.put(url, data=data.encode('utf-8'), headers=headers)
+        if state is not None:
+            state.update(url, data, r)
         status_codes.append(r.status_code)
 
+    if state is not None:
+        state.save()
     return status_codes
 
 
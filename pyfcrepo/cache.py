@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# version of the cached records, bumped when their fields change
+SCHEMA = 2
+
+class MetadataCache:
+    """Persistent cache of parsed resources, keyed by url and revalidated by ETag.
+
+    Entries are evicted least recently used first once max_entries is
+    exceeded.
+    """
+
+    def __init__(self, filename, max_entries=100000):
+        d = os.path.dirname(filename)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA:
+            self.db.execute('DROP TABLE IF EXISTS cache')
+            self.db.execute('PRAGMA user_version = {v}'.format(v=SCHEMA))
+        self.db.execute('''CREATE TABLE IF NOT EXISTS cache (
+                               key TEXT PRIMARY KEY,
+                               etag TEXT,
+                               last_modified TEXT,
+                               data TEXT,
+                               atime REAL)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)')
+        self.db.commit()
+        self.writes = 0
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT etag, last_modified, data FROM cache WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE cache SET atime=? WHERE key=?', (time.time(), key))
+            self.commit()
+        return {'etag': row[0], 'last_modified': row[1], 'data': json.loads(row[2])}
+
+    def put(self, key, data, etag=None, last_modified=None):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+                            (key, etag, last_modified, json.dumps(data), time.time()))
+            self.commit()
+
+    def commit(self):
+        # batch commits, eviction is checked at the same pace
+        self.writes += 1
+        if self.writes % 100 == 0:
+            self.evict()
+            self.db.commit()
+
+    def evict(self):
+        n = self.db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if n > self.max_entries:
+            self.db.execute('''DELETE FROM cache WHERE key IN
+                               (SELECT key FROM cache ORDER BY atime LIMIT ?)''', (n - self.max_entries,))
+
+    def close(self):
+        with self.lock:
+            self.evict()
+            self.db.commit()
+            self.db.close()
+
+def cached_get(client, url, parse, key=None, headers=None, immutable=False):
+    """GET url and parse its text, revalidating a cached parse with If-None-Match/If-Modified-Since.
+
+    Immutable resources (e.g. mementos) are served from the cache without
+    any request. Returns None if the resource could not be read.
+    """
+    cache = client.cache
+    if key is None:
+        key = url
+    headers = dict(headers or {})
+    entry = None
+    if cache is not None:
+        entry = cache.get(key)
+        if entry is not None:
+            if immutable:
+                return entry['data']
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+    r = client.get(url, headers=headers)
+    if r.status_code == 304 and entry is not None:
+        return entry['data']
+    if r.status_code != 200:
+        return None
+    data = parse(r)
+    if cache is not None and (immutable or 'ETag' in r.headers or 'Last-Modified' in r.headers):
+        cache.put(key, data, etag=r.headers.get('ETag'), last_modified=r.headers.get('Last-Modified'))
+    return data
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .versions import VersionIndex
+from .cache import MetadataCache
+from .index import DossierIndex
+from .metrics import Metrics, resource_kind
+from .throttle import RETRY_STATUSES, IDEMPOTENT, TokenBucket, AdaptiveLimit, backoff_delay, retry_after, retryable
+
+class FedoraClient:
+    """Pooled HTTP client shared by every Fedora call.
+
+    One keep-alive connection pool is kept per client, so TCP and auth
+    handshakes are paid once per connection instead of once per resource.
+    Requests in flight are capped by an AIMD limit between min_concurrency
+    and max_concurrency, starting at max_concurrency (and by max_rate
+    requests/s if set); idempotent requests answered with a retryable status
+    or a connection error are retried up to retries times, with jittered
+    exponential backoff.
+    """
+
+    def __init__(self, fedoraUrl, auth, pool_size=10, timeout=60, headers=None, state_dir=None,
+                 cache=False, cache_size=100000, retries=3, backoff=0.5,
+                 min_concurrency=1, max_concurrency=None, max_rate=None):
+        self.fedoraUrl = fedoraUrl
+        self.auth = auth
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        if max_concurrency is None:
+            max_concurrency = pool_size
+        self.limit = AdaptiveLimit(min_concurrency, max_concurrency)
+        self.bucket = TokenBucket(max_rate) if max_rate else None
+        self.state_dir = state_dir
+        self.versions = VersionIndex()
+        self.cache = None
+        self.index = None
+        self.metrics = Metrics()
+        if state_dir is not None:
+            self.versions = VersionIndex(os.path.join(state_dir, 'versions.json'))
+            self.index = DossierIndex(os.path.join(state_dir, 'index.sqlite'))
+            if cache:
+                self.cache = MetadataCache(os.path.join(state_dir, 'cache.sqlite'), max_entries=cache_size)
+        self.session = requests.Session()
+        self.session.auth = auth
+        if headers is not None:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_config(cls, cfg, cfg_set='DEFAULT', min_pool_size=1, cache=True, max_rate=None):
+        section = cfg[cfg_set]
+        fedoraUrl = section['protocol'] + '://' + section['host'] + ':' + section['port'] + '/rest/'
+        auth = (section['user'], section['pwd'])
+        pool_size = max(section.getint('pool_size', fallback=10), min_pool_size)
+        if max_rate is None:
+            max_rate = section.getfloat('max_rate', fallback=0)
+        return cls(fedoraUrl, auth,
+                   pool_size=pool_size,
+                   timeout=section.getfloat('timeout', fallback=60),
+                   state_dir=section.get('state_dir', fallback='.pyfcrepo'),
+                   cache=cache,
+                   cache_size=section.getint('cache_size', fallback=100000),
+                   retries=section.getint('retries', fallback=3),
+                   backoff=section.getfloat('backoff', fallback=0.5),
+                   min_concurrency=section.getint('min_concurrency', fallback=1),
+                   max_concurrency=section.getint('max_concurrency', fallback=pool_size),
+                   max_rate=max_rate)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        kind = resource_kind(url)
+        # transaction control (begin, keepalive, commit) must not queue behind long uploads
+        throttled = kind != 'transaction'
+        attempt = 0
+        while True:
+            if throttled:
+                if self.bucket is not None:
+                    self.bucket.acquire()
+                self.limit.acquire()
+            t = time.perf_counter()
+            r = None
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            seconds = time.perf_counter() - t
+            ok = r is not None and r.status_code not in RETRY_STATUSES
+            if throttled:
+                self.limit.release(seconds, ok, key=None if kind == 'binary' else (method, kind))
+            if r is None:
+                self.metrics.observe(method, url, None, 0, 0, seconds)
+            else:
+                self.metrics.observe(method, url, r.status_code,
+                                     int(r.request.headers.get('Content-Length', 0)), len(r.content),
+                                     seconds)
+            if (ok or method not in IDEMPOTENT or attempt >= self.retries
+                    or (r is not None and not retryable(r, kind))):
+                if r is None:
+                    raise error
+                return r
+            attempt += 1
+            # streamed bodies are sent again from the start
+            data = kwargs.get('data')
+            if hasattr(data, 'seek'):
+                data.seek(0)
+            delay = retry_after(r)
+            time.sleep(delay if delay is not None else backoff_delay(attempt, self.backoff))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.request('PATCH', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+        if self.index is not None:
+            self.index.close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
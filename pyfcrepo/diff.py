@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import json
+from collections import defaultdict
+
+# change categories, as in data/referentials/changes.md
+CREATED = 'created'
+DELETED = 'deleted'
+RENAMED = 'renamed'
+MOVED = 'moved'
+RULES = 'rule-changed'
+CHILDREN = 'children-changed'
+UNCHANGED = 'unchanged'
+
+DESCRIPTION = ['cote', 'title', 'abstract']
+RULE_FIELDS = ['protection', 'closingPeriod', 'retentionPeriod']
+
+def ref_nodes(df):
+    """Referential DataFrame (see referential.read_ref) to {id: node}"""
+    fields = ['parent_id'] + DESCRIPTION + RULE_FIELDS
+    nodes = {}
+    for row in df[['id'] + fields].itertuples(index=False):
+        nodes[int(row[0])] = dict(zip(fields, row[1:]))
+    for node in nodes.values():
+        node['parent_id'] = str(node['parent_id'])
+    children = defaultdict(set)
+    for i, node in nodes.items():
+        if node['parent_id'] != '-':
+            children[int(node['parent_id'])].add(i)
+    for i, node in nodes.items():
+        node['children'] = children[i]
+    return nodes
+
+def diff_ref(old, new):
+    """Compare two referential versions in O(N).
+
+    old and new are DataFrames as returned by referential.read_ref. The
+    plan maps every node id to its list of changes: created, deleted,
+    renamed (call number, title or description), moved (parent),
+    rule-changed, children-changed (the node must be rewritten because
+    its hasOrHadPart list changed) or unchanged.
+    """
+    nodes1 = ref_nodes(old)
+    nodes2 = ref_nodes(new)
+    plan = {}
+    for i, n2 in nodes2.items():
+        n1 = nodes1.get(i)
+        if n1 is None:
+            plan[i] = [CREATED]
+            continue
+        changes = []
+        if any(n1[f] != n2[f] for f in DESCRIPTION):
+            changes.append(RENAMED)
+        if n1['parent_id'] != n2['parent_id']:
+            changes.append(MOVED)
+        if any(n1[f] != n2[f] for f in RULE_FIELDS):
+            changes.append(RULES)
+        if n1['children'] != n2['children']:
+            changes.append(CHILDREN)
+        plan[i] = changes if len(changes) > 0 else [UNCHANGED]
+    for i in nodes1:
+        if i not in nodes2:
+            plan[i] = [DELETED]
+    return {'plan': plan, 'old': nodes1, 'new': nodes2}
+
+def to_write(diff):
+    """Ids of the nodes of the new version that have to be (re)written"""
+    return [i for i, changes in diff['plan'].items() if changes != [UNCHANGED] and changes != [DELETED]]
+
+def to_close(diff):
+    return [i for i, changes in diff['plan'].items() if changes == [DELETED]]
+
+def plan2json(diff):
+    out = []
+    for i, changes in diff['plan'].items():
+        node = diff['new'].get(i, diff['old'].get(i))
+        entry = {'id': i, 'callnr': node['cote'], 'title': node['title'], 'changes': changes}
+        if MOVED in changes:
+            entry['from'] = diff['old'][i]['parent_id']
+            entry['to'] = diff['new'][i]['parent_id']
+        out.append(entry)
+    return out
+
+def write_plan(diff, filename):
+    with open(filename, 'w') as f:
+        json.dump(plan2json(diff), f, indent=1, ensure_ascii=False)
+
+def report(diff):
+    """Human readable dry-run report"""
+    by_change = defaultdict(list)
+    for i, changes in diff['plan'].items():
+        for c in changes:
+            by_change[c].append(i)
+    lines = []
+    for c in [CREATED, DELETED, RENAMED, MOVED, RULES, CHILDREN]:
+        ids = by_change[c]
+        if len(ids) > 0:
+            nodes = diff['old'] if c == DELETED else diff['new']
+            callnrs = sorted(nodes[i]['cote'] for i in ids)
+            lines.append('{c}: {n} ({callnrs})'.format(c=c.capitalize(), n=len(ids), callnrs=', '.join(callnrs)))
+    lines.append('Unchanged: {n}'.format(n=len(by_change[UNCHANGED])))
+    lines.append('Writes: {w}, closes: {d}'.format(w=len(to_write(diff)), d=len(to_close(diff))))
+    return '\n'.join(lines)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import csv
+import json
+
+# referential CSV layout up to the retention period (M22), as read by referential.read_ref
+REF_LAYOUT = ['M1', 'M2', 'M3', 'M4', 'M5', 'M6']
+for m in ['M8', 'M9', 'M10', 'M11']:
+    REF_LAYOUT += [m + '_Id', m + '_ExternalId', m + '_Value']
+REF_LAYOUT += ['M12', 'M13_Id', 'M13_ExternalId', 'M13_Value', 'M14', 'M15_Id', 'M15_ExternalId', 'M15_Value',
+               'M16', 'M17_Id', 'M17_ExternalId', 'M17_Value']
+for m in ['M18.1', 'M18.2', 'M18.3', 'M19.1', 'M19.2', 'M19.3', 'M20', 'M21']:
+    REF_LAYOUT += [m + '_Id', m + '_ExternalId', m + '_Value']
+REF_LAYOUT += ['M22']
+
+# export record field -> referential column
+REF_EXPORT = {'id': 'M1',
+              'parent_id': 'M2',
+              'callnr': 'M3',
+              'title': 'M4',
+              'abstract': 'M5',
+              'protection': 'M11_ExternalId',
+              'closingPeriod': 'M18.1_ExternalId',
+              'retentionPeriod': 'M22'}
+
+def node_rules(md):
+    """protection, closingPeriod and retentionPeriod codes from the rule urls of a node"""
+    out = {'protection': '', 'closingPeriod': '', 'retentionPeriod': ''}
+    for url in md.get('rules', []):
+        rule = url.split('/')[-1]
+        for name in out:
+            if rule.startswith(name):
+                out[name] = rule[len(name):]
+    # load_ref writes retention periods with a trailing A (10 -> retentionPeriod10A)
+    if out['retentionPeriod'].endswith('A'):
+        out['retentionPeriod'] = out['retentionPeriod'][:-1]
+    return out
+
+def node_export(md, depth):
+    """Flat export record of a node fetched by referential.get_node"""
+    out = {'id': md['url'].split('/')[-1],
+           'parent_id': md.get('parent_id', '-').split('/')[-1] if depth > 0 else '-',
+           'depth': depth,
+           'callnr': md['callnr'],
+           'title': md['title'],
+           'abstract': md.get('abstract', ''),
+           'version': md['version'],
+           'url': md['url']}
+    out.update(node_rules(md))
+    return out
+
+# subtrees are wrapped in two lists, as the nested lists of referential.traverse rendered by tree2html
+HTML_OPEN = '\n<ul>\n<ul>'
+HTML_CLOSE = '</ul>\n</ul>\n'
+
+class HtmlWriter:
+    """Collapsible HTML list, the root node is left out"""
+
+    def __init__(self, f, version=None):
+        self.f = f
+        self.depth = 0
+        f.write('<html>\n')
+        f.write('''<style>
+                       ul {list-style: none;}
+                       a { text-decoration: none;}
+            </style>''')
+        f.write('<body>\n')
+        f.write('<h3> Tree </h3>\n')
+        if version is not None:
+            f.write('version {version}'.format(version=version))
+        f.write('<ul class="collapsibleList">\n')
+
+    def write(self, depth, md):
+        if depth == 0:
+            return
+        while self.depth > depth:
+            self.f.write(HTML_CLOSE)
+            self.depth -= 1
+        if depth > max(self.depth, 1):
+            self.f.write(HTML_OPEN)
+        self.depth = depth
+        self.f.write('\n<li><a href="{href}" title="{title}">'.format(href=md['url'], title=md['title'])
+                     + md['callnr'] + '-' + md['title'] + '</a></li>\n')
+
+    def close(self):
+        while self.depth > 1:
+            self.f.write(HTML_CLOSE)
+            self.depth -= 1
+        self.f.write('</ul>\n')
+        self.f.write('\n<script type="text/javascript">CollapsibleLists.apply();</script>\n')
+        self.f.write('</body>\n')
+        self.f.write('</html>')
+
+class JsonWriter:
+    """One nested JSON document, children in a children list"""
+
+    def __init__(self, f, version=None):
+        self.f = f
+        self.depth = -1
+
+    def write(self, depth, md):
+        if self.depth >= 0:
+            if depth > self.depth:
+                self.f.write(',\n"children": [\n')
+            else:
+                self.f.write('}' + ']}' * (self.depth - depth) + ',\n')
+        self.depth = depth
+        # leave the object open for its children
+        self.f.write(json.dumps(node_export(md, depth), ensure_ascii=False)[:-1])
+
+    def close(self):
+        if self.depth >= 0:
+            self.f.write('}' + ']}' * self.depth)
+        self.f.write('\n')
+
+class NdjsonWriter:
+    """One JSON object per node and line, in depth-first order"""
+
+    def __init__(self, f, version=None):
+        self.f = f
+
+    def write(self, depth, md):
+        self.f.write(json.dumps(node_export(md, depth), ensure_ascii=False) + '\n')
+
+    def close(self):
+        pass
+
+class CsvWriter:
+    """Referential CSV (M1..M22 layout), loadable again with loadref and updateref"""
+
+    def __init__(self, f, version=None):
+        self.f = f
+        self.writer = csv.writer(f, delimiter=';', lineterminator='\n')
+        self.writer.writerow(REF_LAYOUT)
+
+    def write(self, depth, md):
+        x = node_export(md, depth)
+        if depth == 0:
+            # the root row only carries its id
+            row = dict.fromkeys(REF_LAYOUT, '-')
+            row['M1'] = x['id']
+        else:
+            row = dict.fromkeys(REF_LAYOUT, '')
+            for field, column in REF_EXPORT.items():
+                row[column] = x[field]
+        self.writer.writerow([row[c] for c in REF_LAYOUT])
+
+    def close(self):
+        pass
+
+FORMATS = {'html': HtmlWriter, 'json': JsonWriter, 'ndjson': NdjsonWriter, 'csv': CsvWriter}
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+def search(client, condition, fields='fedora_id', page_size=1000):
+    """Stream the items of an fcr:search query, one page at a time"""
+    offset = 0
+    while True:
+        url = client.fedoraUrl + 'fcr:search?condition={c}&fields={f}&offset={o}&max_results={m}'.format(
+            c=quote(condition, safe=''), f=fields, o=offset, m=page_size)
+        r = client.get(url)
+        if r.status_code != 200:
+            print('ERROR')
+            print(r.status_code)
+            return
+        page = r.json()
+        items = page.get('items', [])
+        for x in items:
+            yield x
+        offset += len(items)
+        total = page.get('pagination', {}).get('totalResults')
+        if len(items) == 0 or (total is not None and offset >= total):
+            return
+
+class DossierIndex:
+    """Local index referential node -> dossiers attached to it, per unit
+
+    A unit's index is only complete once built from the repository;
+    incremental updates are only recorded into a built index.
+    """
+
+    def __init__(self, filename):
+        d = os.path.dirname(filename)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS dossiers (
+                               unit TEXT,
+                               dossier TEXT PRIMARY KEY,
+                               parent TEXT)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS dossiers_parent ON dossiers (unit, parent)')
+        # units whose index was rebuilt from the repository, see referential.index_records
+        self.db.execute('CREATE TABLE IF NOT EXISTS built (unit TEXT PRIMARY KEY)')
+        self.db.commit()
+
+    def set(self, unit, dossier, parent):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO dossiers VALUES (?, ?, ?)', (unit.lower(), dossier, parent))
+            self.db.commit()
+
+    def set_many(self, unit, pairs):
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO dossiers VALUES (?, ?, ?)',
+                                [(unit.lower(), d, p) for d, p in pairs])
+            self.db.commit()
+
+    def dossiers(self, unit, parent):
+        with self.lock:
+            rows = self.db.execute('SELECT dossier FROM dossiers WHERE unit=? AND parent=? ORDER BY dossier',
+                                   (unit.lower(), parent)).fetchall()
+        return [r[0] for r in rows]
+
+    def built(self, unit):
+        """True once the index of unit holds all its dossiers"""
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM built WHERE unit=?', (unit.lower(),)).fetchone() is not None
+
+    def mark_built(self, unit):
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO built VALUES (?)', (unit.lower(),))
+            self.db.commit()
+
+    def count(self, unit):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM dossiers WHERE unit=?', (unit.lower(),)).fetchone()[0]
+
+    def clear(self, unit):
+        with self.lock:
+            self.db.execute('DELETE FROM dossiers WHERE unit=?', (unit.lower(),))
+            self.db.execute('DELETE FROM built WHERE unit=?', (unit.lower(),))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+def payload_hash(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return 'sha-256=' + hashlib.sha256(data).hexdigest()
+
+class Journal:
+    """Append-only log of completed writes, one JSON line (url, hash, status) per write.
+
+    Lines are handed to the OS as they are written, so a crashed process
+    loses nothing; fsync is batched every sync_every lines or sync_interval
+    seconds. Without resume, an existing journal is started afresh. Only
+    the entries of the journal being resumed are held in memory, new
+    writes are just appended.
+    """
+
+    def __init__(self, filename, resume=False, sync_every=256, sync_interval=1.0):
+        d = os.path.dirname(filename)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        self.filename = filename
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.entries = {}
+        # resumed entries written again during this run
+        self.rewritten = set()
+        self.resumed_lines = 0
+        torn = False
+        if resume and os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    self.resumed_lines += 1
+                    torn = not line.endswith('\n')
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        # torn last line of a crashed run
+                        continue
+                    self.entries[e['url']] = (e['hash'], e['status'])
+        self.f = open(filename, 'a' if resume else 'w')
+        if torn:
+            self.f.write('\n')
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    def done(self, url, digest):
+        """True if url was already written with this payload by the resumed run"""
+        e = self.entries.get(url)
+        return e is not None and e[0] == digest and e[1] < 400
+
+    def record(self, url, digest, status):
+        line = json.dumps({'url': url, 'hash': digest, 'status': status}) + '\n'
+        with self.lock:
+            if url in self.entries:
+                self.rewritten.add(url)
+            self.f.write(line)
+            self.f.flush()
+            self.pending += 1
+            if self.pending >= self.sync_every or time.monotonic() - self.synced >= self.sync_interval:
+                self.fsync()
+
+    def fsync(self):
+        os.fsync(self.f.fileno())
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    def compact(self):
+        """Rewrite the journal with the last successful entry of each url, streaming it
+
+        A resumed line is kept if it is the last one of its url in the
+        resumed journal and the url was not written again; lines of this
+        run are kept if successful.
+        """
+        with self.lock:
+            self.f.flush()
+            tmp = self.filename + '.tmp'
+            with open(self.filename) as f, open(tmp, 'w') as out:
+                for n, line in enumerate(f):
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue
+                    if e['status'] >= 400:
+                        continue
+                    if n < self.resumed_lines:
+                        if e['url'] in self.rewritten or self.entries.get(e['url']) != (e['hash'], e['status']):
+                            continue
+                    out.write(json.dumps({'url': e['url'], 'hash': e['hash'], 'status': e['status']}) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+            self.f.close()
+            os.replace(tmp, self.filename)
+            self.f = open(self.filename, 'a')
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.f.flush()
+            self.fsync()
+            self.f.close()
+
+class JournalBatch:
+    """Writes of a transaction, recorded in the journal once it is committed"""
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.writes = []
+
+    def done(self, url, digest):
+        return self.journal.done(url, digest)
+
+    def record(self, url, digest, status):
+        self.writes.append((url, digest, status))
+
+    def commit(self):
+        for w in self.writes:
+            self.journal.record(*w)
+        self.writes = []
+
+def open_journal(client, name, resume=False):
+    """Journal state_dir/journal/name.jsonl of the client, None without a state directory"""
+    if client.state_dir is None:
+        return None
+    return Journal(os.path.join(client.state_dir, 'journal', name + '.jsonl'), resume=resume)
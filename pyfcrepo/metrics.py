@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import io
+import sys
+import json
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import defaultdict
+
+# latency histogram upper bounds (s)
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf')]
+
+def resource_kind(url):
+    """Kind of Fedora resource addressed by url, used to break metrics down"""
+    if 'fcr:search' in url:
+        return 'search'
+    if 'fcr:tx' in url:
+        return 'transaction'
+    if 'fcr:versions' in url:
+        return 'versions'
+    if url.endswith('/binary'):
+        return 'binary'
+    if '/documents' in url:
+        return 'document'
+    if '/dossiers' in url:
+        return 'dossier'
+    if '/referential' in url:
+        return 'referential'
+    if '/agents' in url:
+        return 'agent'
+    return 'other'
+
+class Operation:
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = defaultdict(int)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.conflicts = 0
+        self.buckets = [0] * len(BUCKETS)
+
+class Metrics:
+    """Per (HTTP method, resource kind) request counts, statuses, bytes and latency histograms"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = defaultdict(Operation)
+
+    def observe(self, method, url, status, bytes_sent, bytes_received, seconds):
+        """Record one request; status is None when no response was received"""
+        with self.lock:
+            op = self.operations[(method, resource_kind(url))]
+            op.count += 1
+            op.statuses['error' if status is None else str(status)] += 1
+            op.bytes_sent += bytes_sent
+            op.bytes_received += bytes_received
+            op.seconds += seconds
+            op.max_seconds = max(op.max_seconds, seconds)
+            for i, le in enumerate(BUCKETS):
+                if seconds <= le:
+                    op.buckets[i] += 1
+                    break
+
+    def conflict(self, method, url):
+        """Record a write refused with 412 (the resource changed since it was read) and retried"""
+        with self.lock:
+            self.operations[(method, resource_kind(url))].conflicts += 1
+
+    def summary(self):
+        out = []
+        with self.lock:
+            for (method, kind), op in sorted(self.operations.items()):
+                out.append({'method': method, 'kind': kind, 'count': op.count,
+                            'statuses': dict(op.statuses), 'conflicts': op.conflicts,
+                            'bytes_sent': op.bytes_sent, 'bytes_received': op.bytes_received,
+                            'seconds': round(op.seconds, 6),
+                            'mean_ms': round(1000 * op.seconds / op.count, 3),
+                            'max_ms': round(1000 * op.max_seconds, 3),
+                            'latency_buckets': {str(le): n for le, n in zip(BUCKETS, op.buckets)}})
+        return out
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=1)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = ['# TYPE pyfcrepo_requests_total counter']
+        series = []
+        with self.lock:
+            items = sorted(self.operations.items())
+            for (method, kind), op in items:
+                for status, n in sorted(op.statuses.items()):
+                    lines.append('pyfcrepo_requests_total{{method="{m}",kind="{k}",status="{s}"}} {n}'.format(
+                        m=method, k=kind, s=status, n=n))
+            for name, attr in [('pyfcrepo_request_bytes_sent_total', 'bytes_sent'),
+                               ('pyfcrepo_response_bytes_received_total', 'bytes_received'),
+                               ('pyfcrepo_write_conflicts_total', 'conflicts')]:
+                lines.append('# TYPE {name} counter'.format(name=name))
+                for (method, kind), op in items:
+                    lines.append('{name}{{method="{m}",kind="{k}"}} {v}'.format(
+                        name=name, m=method, k=kind, v=getattr(op, attr)))
+            lines.append('# TYPE pyfcrepo_request_duration_seconds histogram')
+            for (method, kind), op in items:
+                labels = 'method="{m}",kind="{k}"'.format(m=method, k=kind)
+                cumulative = 0
+                for le, n in zip(BUCKETS, op.buckets):
+                    cumulative += n
+                    lines.append('pyfcrepo_request_duration_seconds_bucket{{{labels},le="{le}"}} {n}'.format(
+                        labels=labels, le='+Inf' if le == float('inf') else le, n=cumulative))
+                lines.append('pyfcrepo_request_duration_seconds_sum{{{labels}}} {v}'.format(labels=labels, v=op.seconds))
+                lines.append('pyfcrepo_request_duration_seconds_count{{{labels}}} {v}'.format(labels=labels, v=op.count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, fmt='json', filename=None):
+        text = self.to_prometheus() if fmt == 'prometheus' else self.to_json() + '\n'
+        if filename is None:
+            print(text, end='')
+        else:
+            with open(filename, 'w') as f:
+                f.write(text)
+
+class Profiler:
+    """cProfile and tracemalloc around an action, reports written to directory
+
+    Before Python 3.12 cProfile only sees the thread that enabled it: every
+    thread started meanwhile (request workers) gets its own profile, merged
+    into the report.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.profile = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.thread_profiles = []
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tracemalloc.start()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.profile_thread)
+        self.profile.enable()
+
+    def profile_thread(self, frame, event, arg):
+        # first event of a new thread: replace this hook by a profile of the thread
+        p = cProfile.Profile()
+        with self.lock:
+            self.thread_profiles.append(p)
+        p.enable()
+
+    def stop(self, metrics=None):
+        self.profile.disable()
+        threading.setprofile(None)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        s = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=s)
+        with self.lock:
+            for p in self.thread_profiles:
+                stats.add(p)
+        stats.dump_stats(os.path.join(self.directory, 'profile.pstats'))
+        stats.sort_stats('cumulative').print_stats(50)
+        with open(os.path.join(self.directory, 'profile.txt'), 'w') as f:
+            f.write(s.getvalue())
+
+        with open(os.path.join(self.directory, 'tracemalloc.txt'), 'w') as f:
+            f.write('current {c:.1f} MB, peak {p:.1f} MB\n\n'.format(c=current / 2**20, p=peak / 2**20))
+            for stat in snapshot.statistics('lineno')[:30]:
+                f.write(str(stat) + '\n')
+
+        if metrics is not None:
+            metrics.write('json', os.path.join(self.directory, 'metrics.json'))
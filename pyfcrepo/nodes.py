@@ -10,9 +10,12 @@
 # Author : Jan Krause-Bilvin
 # First release: 2022-03-03
 
-import requests
+import time
 
-def create_basic(url, auth, title, description, recordType=None, children=None, archivalUnit=False):
+from . import rdf
+from .throttle import backoff_delay
+
+def create_basic(url, client, title, description, recordType=None, children=None, archivalUnit=False):
     headers = {"Content-Type": "text/turtle"}
     if archivalUnit:
         headers["Link"] = '<http://fedora.info/definitions/v4/repository#ArchivalGroup>;rel="type"'
@@ -24,7 +27,71 @@ def create_basic(url, auth, title, description, recordType=None, children=None,
         data += '<>  rico:type  {recordType}.\n'.format(recordType=recordType)
     if children is not None:
         data += '<>  rico:hasOrHadPart <{childrenStr}>.\n'.format(childrenStr=children)
-    r = requests.put(url, auth=auth, data=data.encode('utf-8'), headers=headers)
+    r = client.put(url, data=data.encode('utf-8'), headers=headers)
     #print(data)
     #print(r.text)
-    return r.status_code
\ No newline at end of file
+    return r.status_code
+
+RICO = 'https://www.ica.org/standards/RiC/ontology#'
+
+def iri(url):
+    return '<' + url + '>'
+
+def literal(s):
+    return '"' + s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+def patch_node(url, client, replace, add=None, headers=None):
+    """Update some triples of a node with a SPARQL-Update PATCH, without reading it first
+
+    replace maps rico predicates (e.g. 'hasRecordState') to their new object
+    term (iri(...) or literal(...)), whatever their current objects are; add
+    is a list of (predicate, term) inserted alongside the existing triples.
+    """
+    add = add or []
+    deletes = ''.join('<> rico:{p} ?o{i} .\n'.format(p=p, i=i) for i, p in enumerate(replace))
+    inserts = ''.join('<> rico:{p} {o} .\n'.format(p=p, o=o) for p, o in list(replace.items()) + add)
+    where = ''.join('OPTIONAL {{ <> rico:{p} ?o{i} }}\n'.format(p=p, i=i) for i, p in enumerate(replace))
+    data = """PREFIX rico: <{rico}>
+DELETE {{
+{deletes}}}
+INSERT {{
+{inserts}}}
+WHERE {{
+{where}}}
+""".format(rico=RICO, deletes=deletes, inserts=inserts, where=where)
+    h = {"Content-Type": "application/sparql-update"}
+    if headers is not None:
+        h.update(headers)
+    r = client.patch(url, data=data.encode('utf-8'), headers=h)
+    return r.status_code
+
+def update_node(url, client, change, retries=5):
+    """Read-modify-write of a node, guarded by the ETag of the read
+
+    change(text) gets the N-Triples of the node and returns the (replace,
+    add) arguments of patch_node, or None when the node is already as
+    wanted. The PATCH carries If-Match; on 412 the node changed in
+    between: it is read again and change applied anew after a jittered
+    backoff, at most retries times, each retry counted as a conflict.
+    Returns (status, changed); changed is False when nothing was
+    written, status then being the one of the read.
+    """
+    for attempt in range(retries + 1):
+        r = client.get(url, headers=rdf.node_headers())
+        if r.status_code != 200:
+            print('ERROR')
+            print(r.status_code)
+            return r.status_code, False
+        update = change(r.text)
+        if update is None:
+            return r.status_code, False
+        replace, add = update
+        headers = {}
+        if 'ETag' in r.headers:
+            headers['If-Match'] = r.headers['ETag']
+        sc = patch_node(url, client, replace, add=add, headers=headers)
+        if sc != 412 or attempt == retries:
+            return sc, sc < 400
+        client.metrics.conflict('PATCH', url)
+        # jitter, so that competing writers do not collide again
+        time.sleep(backoff_delay(attempt + 1, client.backoff))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import re
+from collections import defaultdict
+
+NTRIPLES = 'application/n-triples'
+
+RICO = 'https://www.ica.org/standards/RiC/ontology#'
+PREMIS = 'http://id.loc.gov/vocabulary/preservation/'
+LDP = 'http://www.w3.org/ns/ldp#'
+
+# Prefer header of node reads: only the user triples, without the server
+# managed ones nor the (possibly huge) ldp:contains and membership lists
+OMIT_SERVER_MANAGED = ('return=representation; omit="http://fedora.info/definitions/fcrepo#ServerManaged '
+                       + LDP + 'PreferContainment ' + LDP + 'PreferMembership"')
+
+def node_headers():
+    """Request headers of a node read: N-Triples, server managed triples omitted"""
+    return {'Accept': NTRIPLES, 'Prefer': OMIT_SERVER_MANAGED}
+
+# predicate -> (field, multi-valued)
+NODE_FIELDS = {
+    RICO + 'title': ('title', False),
+    RICO + 'hasOrHadIdentifier': ('callnr', False),
+    PREMIS + 'version': ('version', False),
+    RICO + 'isOrWasPartOf': ('parent_id', False),
+    RICO + 'hasOrHadPart': ('children', True),
+    RICO + 'scopeAndContent': ('abstract', False),
+    RICO + 'isOrWasRegulatedBy': ('rules', True),
+}
+
+ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+ESCAPES = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+def unescape(s):
+    def sub(m):
+        if m.group(1) or m.group(2):
+            return chr(int(m.group(1) or m.group(2), 16))
+        return ESCAPES.get(m.group(3), m.group(3))
+    return ESCAPE.sub(sub, s)
+
+def parse_object(o):
+    """N-Triples object term to a python string (IRI or literal value)"""
+    if o[0] == '<':
+        return o[1:-1]
+    if o[0] == '"':
+        end = o.rindex('"')
+        value = o[1:end]
+        if '\\' in value:
+            value = unescape(value)
+        return value
+    return o
+
+def split_triple(line):
+    """Split an N-Triples line into its three terms, or None for blank/comment lines"""
+    parts = line.split(None, 2)
+    if len(parts) < 3 or parts[0][0] == '#':
+        return None
+    o = parts[2].rstrip()
+    if o.endswith('.'):
+        o = o[:-1].rstrip()
+    return parts[0], parts[1], o
+
+def parse_ntriples(lines, predicates=None):
+    """Yield (subject, predicate, object) from N-Triples lines.
+
+    With predicates, other triples are skipped before their object is
+    parsed.
+    """
+    for line in lines:
+        t = split_triple(line)
+        if t is None:
+            continue
+        p = t[1][1:-1]
+        if predicates is not None and p not in predicates:
+            continue
+        s = t[0]
+        if s[0] == '<':
+            s = s[1:-1]
+        yield s, p, parse_object(t[2])
+
+OBJECT = r'(<[^>]*>|"(?:[^"\\]|\\.)*"(?:@[\w-]+|\^\^<[^>]*>)?|_:\S+)'
+
+def namespace(iri):
+    i = max(iri.rfind('#'), iri.rfind('/'))
+    return iri[:i+1], iri[i+1:]
+
+def object_patterns(predicates):
+    """Regexes finding (local name, object term) of the given predicates anywhere in an N-Triples document.
+
+    There is one pattern per namespace, starting with the literal namespace
+    IRI, so the regex engine skips to candidate positions without visiting
+    every line.
+    """
+    by_ns = defaultdict(list)
+    for p in predicates:
+        ns, local = namespace(p)
+        by_ns[ns].append(local)
+    patterns = []
+    for ns, locals_ in by_ns.items():
+        alternatives = '|'.join(re.escape(l) for l in sorted(locals_, key=len, reverse=True))
+        patterns.append( (ns, re.compile('<' + re.escape(ns) + '(' + alternatives + ')>[ \t]+' + OBJECT)) )
+    return patterns
+
+NODE_PATTERNS = object_patterns(NODE_FIELDS)
+
+def node_record(text, url, fields=NODE_FIELDS):
+    """Compact per-node record from an N-Triples representation"""
+    out = {'url':url, 'title':'None', 'callnr':'X', 'version':'None', 'children':[]}
+    patterns = NODE_PATTERNS if fields is NODE_FIELDS else object_patterns(fields)
+    for ns, pattern in patterns:
+        values = defaultdict(list)
+        for local, o in pattern.findall(text):
+            values[local].append(o)
+        for local, terms in values.items():
+            field, multi = fields[ns + local]
+            if multi:
+                out[field] = [o[1:-1] if o[0] == '<' else parse_object(o) for o in terms]
+            else:
+                out[field] = parse_object(terms[-1])
+    return out
+
+def objects(text, predicate):
+    return [o for s, p, o in parse_ntriples(text.split('\n'), predicates={predicate})]
@@ -10,11 +10,19 @@
 # Author : Jan Krause-Bilvin
 # First release: 2022-03-03
 
-import requests
 import pandas as pd
 from . import nodes
+from .transaction import Transaction, TransactionError
+from .journal import payload_hash, open_journal, JournalBatch
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+import threading
+import hashlib
+import mmap
+import os
 
 #############
 ## helpers ##
@@ -24,14 +32,61 @@ def id2code(unitCode, i, nodeType='r'):
     #return unitCode.lower() +'/'+ str(nodeType) + str(i)
     return 'records/'+ unitCode.lower() + '/dossiers/' + str(i)
 
+def put_once(client, url, data, headers, journal=None):
+    """PUT a turtle payload unless the journal has it written already; status, or None if skipped"""
+    body = data.encode('utf-8')
+    if journal is None:
+        return client.put(url, data=body, headers=headers).status_code
+    digest = payload_hash(body)
+    if journal.done(url, digest):
+        return None
+    r = client.put(url, data=body, headers=headers)
+    journal.record(url, digest, r.status_code)
+    return r.status_code
+
+DIGESTS = {'sha': 'sha1', 'sha-256': 'sha256', 'sha-512': 'sha512'}
+
+def file_digest(filename, algorithm='sha-512', chunksize=1<<24):
+    """Hex digest of a file, read through a memory map in fixed-size slices"""
+    h = hashlib.new(DIGESTS[algorithm])
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for i in range(0, len(m), chunksize):
+                h.update(m[i:i+chunksize])
+    return h.hexdigest()
+
+class ByteBudget:
+    """Global cap on the number of binary bytes being uploaded at once"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.inflight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n):
+        # a file larger than the cap is let through alone
+        n = min(n, self.max_bytes)
+        with self.cond:
+            while self.inflight + n > self.max_bytes:
+                self.cond.wait()
+            self.inflight += n
+        return n
+
+    def release(self, n):
+        with self.cond:
+            self.inflight -= n
+            self.cond.notify_all()
+
 ######################
 ## load refernetial ##
 ######################
     
-def create_dossier(fedoraUrl, auth, unit, 
+def create_dossier(fedoraUrl, client, unit, 
                    did='D1', callnr='M.10.01-D2', parent='acv/referential/235', children=[1],
                    creator = 'agents/roche/66', title='Test title', description='Desc.',
-                   transaction = None  ):
+                   transaction = None, journal=None  ):
 
     status_codes = []       
     urlRecords = fedoraUrl + 'records/' 
@@ -83,15 +138,25 @@ def create_dossier(fedoraUrl, auth, unit,
                        identifier=cote,
                        state=recordState,
                        recSetType=recordSetType)
-    r = requests.put(urlDossier, auth=auth, data=data.encode('utf-8'), headers=headers2)
-    #print(urlDossier)
-    #print(data)
-    #print(r.status_code)
-    
-    status_codes.append(r.status_code)
+    sc = put_once(client, urlDossier, data, headers2, journal=journal)
+    if sc is not None:
+        status_codes.append(sc)
     return status_codes
 
-def create_document(fedoraUrl, auth, unit, did='1', parent='D1', 
+def create_documents_container(documentsUrl, client, transaction=None, journal=None):
+    headers = {"Content-Type": "text/turtle"}
+
+    if transaction is not None:
+        headers['Atomic-ID']=transaction    
+    
+    data = """ @prefix rico: <https://www.ica.org/standards/RiC/ontology#> .
+               @prefix premis: <http://id.loc.gov/vocabulary/preservation/> .
+               <>  rico:title 'documents'.
+               <>  rico:scopeAndContent   'Docuements container.'.
+               """
+    return put_once(client, documentsUrl, data, headers, journal=journal)
+
+def create_document(fedoraUrl, client, unit, did='1', parent='D1', 
                     filename='data\\records\\files\\file.pdf', 
                     mimetype='application/pdf', instanciation='i1',
                     title='A document', description='A PDF document.',
@@ -100,7 +165,8 @@ def create_document(fedoraUrl, auth, unit, did='1', parent='D1',
                     envName='Ubuntu', envVersion='22.04',
                     creatingApp='LibreOffice', creatingAppVersion='7.3.1',
                     inhibitorType='AES', inhibitorKey='1af4b6c5d94',
-                    transaction = None ):
+                    transaction = None, digest='sha-512',
+                    container=True, budget=None, journal=None ):
     
     status_codes = []
     
@@ -108,19 +174,10 @@ def create_document(fedoraUrl, auth, unit, did='1', parent='D1',
     documentsUrl = urlDossier + '/documents'
     typesUrl = fedoraUrl + 'types'
     
-    headers = {"Content-Type": "text/turtle"}
-
-    if transaction is not None:
-        headers['Atomic-ID']=transaction    
-    
-    
-    data = """ @prefix rico: <https://www.ica.org/standards/RiC/ontology#> .
-               @prefix premis: <http://id.loc.gov/vocabulary/preservation/> .
-               <>  rico:title 'documents'.
-               <>  rico:scopeAndContent   'Docuements container.'.
-               """
-    r = requests.put(documentsUrl, auth=auth, data=data.encode('utf-8'), headers=headers)
-    status_codes.append( r.status_code )
+    if container:
+        sc = create_documents_container(documentsUrl, client, transaction=transaction, journal=journal)
+        if sc is not None:
+            status_codes.append( sc )
     
     documentUrl = documentsUrl + '/' + did
     instantiationUrl = documentUrl + '/' + instanciation
@@ -138,8 +195,9 @@ def create_document(fedoraUrl, auth, unit, did='1', parent='D1',
                <>  rico:type <http://localhost:8080/rest/types/document>.
                <>  rico:hasInstantiation <{instantiation}>.
                """.format(instantiation=instantiationUrl, title=title, description=description)
-    r = requests.put(documentUrl, auth=auth, data=data.encode('utf-8'), headers=headers)
-    status_codes.append( r.status_code )
+    sc = put_once(client, documentUrl, data, headers, journal=journal)
+    if sc is not None:
+        status_codes.append( sc )
     #print(data)
     
     headers = {"Content-Type": "text/turtle"}
@@ -165,8 +223,9 @@ def create_document(fedoraUrl, auth, unit, did='1', parent='D1',
                <>  rico:type premis:representation.
                """.format(instantiation=instantiationUrl, filename=filename, mimetype=mimetype, ricoType=typesUrl+'/instantiation',
                            fmtName=fmtName, fmtVersion=fmtVersion, fmtRegistry=fmtRegistry, fmt=fmt, envName=envName, envVersion=envVersion, creatingApp=creatingApp, creatingAppVersion=creatingAppVersion)
-    r = requests.put(instantiationUrl, auth=auth, data=data.encode('utf-8'), headers=headers)
-    status_codes.append( r.status_code )  
+    sc = put_once(client, instantiationUrl, data, headers, journal=journal)
+    if sc is not None:
+        status_codes.append( sc )
     #print(data)
     
     headers3 = {"Content-Type": mimetype,
@@ -174,74 +233,225 @@ def create_document(fedoraUrl, auth, unit, did='1', parent='D1',
                 
     if transaction is not None:
         headers3['Atomic-ID']=transaction  
-        
-    data = open(filename,'rb').read()
 
-    r = requests.put(instantiationUrl+'/binary', auth=auth, data=data, headers=headers3)
+    # the file is streamed from disk; Fedora checks it against the digest
+    binaryUrl = instantiationUrl + '/binary'
+    fileDigest = None
+    if digest is not None:
+        fileDigest = digest + '=' + file_digest(filename, algorithm=digest)
+        headers3['Digest'] = fileDigest
+    if journal is not None:
+        if fileDigest is None:
+            fileDigest = 'sha-512=' + file_digest(filename)
+        if journal.done(binaryUrl, fileDigest):
+            return( status_codes )
+    size = 0
+    if budget is not None:
+        size = budget.acquire(os.path.getsize(filename))
+    try:
+        with open(filename,'rb') as data:
+            r = client.put(binaryUrl, data=data, headers=headers3)
+    finally:
+        if budget is not None:
+            budget.release(size)
+    if journal is not None:
+        journal.record(binaryUrl, fileDigest, r.status_code)
     status_codes.append( r.status_code )
     
     return( status_codes )
 
-def load_records(fedoraUrl, auth, unit, creator='agents/roche/66',
-                 filename="data\\records\\records.csv"):
+# manifest columns used to load a dossier
+MANIFEST_COLUMNS = ['id', 'type', 'callnr', 'parent', 'instance', 'title', 'description', 'mimetype', 'filename']
+
+def group_dossiers(df):
+    """Rows of a records manifest grouped per dossier, in file order, in one pass"""
+    dossiers = {}
+    for row in df[MANIFEST_COLUMNS].itertuples(index=False):
+        dossiers.setdefault(row.id, []).append(row)
+    return list(dossiers.values())
+
+def stream_dossiers(filename, chunksize=10000):
+    """Rows of a records manifest grouped per dossier, reading the file in chunks
+
+    The manifest must be sorted by dossier: a dossier is complete as soon as
+    a row of another dossier is read, so only the current chunk and dossier
+    are held in memory. The ids of the dossiers already read are kept too,
+    to raise ValueError when the manifest turns out not to be sorted: this
+    set grows with the number of dossiers (tens of bytes per dossier), not
+    with their size.
+    """
+    dossier = []
+    done = set()
+    for chunk in pd.read_csv(filename, sep=";", usecols=MANIFEST_COLUMNS, dtype=str, chunksize=chunksize):
+        # empty cells as empty strings, as in load_records
+        chunk = chunk.fillna('')
+        for row in chunk[MANIFEST_COLUMNS].itertuples(index=False):
+            if len(dossier) > 0 and row.id != dossier[0].id:
+                done.add(dossier[0].id)
+                if row.id in done:
+                    raise ValueError('manifest not sorted by dossier: {id}'.format(id=row.id))
+                yield dossier
+                dossier = []
+            dossier.append(row)
+    if len(dossier) > 0:
+        yield dossier
+
+def batched(iterable, n):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if len(batch) == 0:
+            return
+        yield batch
+
+def load_dossier(fedoraUrl, client, unit, dossier, creator='agents/roche/66',
+                 transaction=None, budget=None, journal=None):
+    """Create a dossier, its documents container and its documents, in dependency order
 
+    dossier is the list of manifest rows of one dossier (see group_dossiers).
+    """
     status_codes = []
-    df = pd.read_csv(filename, sep=";")
+
+    dos = [row for row in dossier if row.type == 'dossier'][0]
+    docs = [row for row in dossier if row.type == 'document']
+    doc_ids = [doc.callnr for doc in docs]
     
-    df['id'] = df['id'].astype(str)
-    df['type'] = df['type'].astype(str)
-    df['callnr'] = df['callnr'].astype(str)
-    df['parent'] = df['parent']
-    df['title'] = df['title'].astype(str)
-    df['description'] = df['description'].astype(str)
-    df['instance'] = df['instance'].astype(str)
-    df['filename'] = df['filename'].astype(str)
-    df['fmt'] = df['fmt'].astype(str)
-    df['mimetype'] = df['mimetype'].astype(str)
-
-    dossiers = pd.unique( df['id'] )
-        
-    for d in dossiers:
-        
-        # BEGIN TRANSACTION
-        #url = "http://localhost:8080/rest/fcr:tx"
-        #r = requests.post(url, auth=auth)
-        #tx = r.headers['Location']
-        #print( 'Begin transaction:', tx )
+    # create dossier
+    parent = unit.lower() + '/' + dos.parent #str(int(dos['parent']))
+    sc = create_dossier(fedoraUrl, client, unit, 
+                   did=dos.id, callnr=dos.callnr, 
+                   parent=parent, children=doc_ids,
+                   creator = creator,
+                   title=dos.title, description=dos.description,
+                   transaction = transaction, journal=journal)
+    status_codes += sc
+
+    # create documents container, once per dossier
+    documentsUrl = fedoraUrl + id2code( unit, dos.id, nodeType='r' ) + '/documents'
+    sc = create_documents_container(documentsUrl, client, transaction=transaction, journal=journal)
+    if sc is not None:
+        status_codes.append( sc )
     
-        dossier = df[ df['id'] == d ]
+    for doc in docs:
         
-        dos = dossier[ dossier['type'] == 'dossier' ]
-        docs = dossier[ dossier['type'] == 'document' ]
-        doc_ids = docs['callnr'].tolist()
-        
-        # create dossier
-        parent = unit.lower() + '/' + dos['parent'].values[0] #str(int(dos['parent']))
-        sc = create_dossier(fedoraUrl, auth, unit, 
-                       did=dos['id'].values[0], callnr=dos['callnr'].values[0], 
-                       parent=parent, children=doc_ids,
-                       creator = creator,
-                       title=dos['title'].values[0], description=dos['description'].values[0],
-                       transaction = None)
+        # create document
+        sc = create_document(fedoraUrl, client, unit, did=doc.callnr,
+                       parent=dos.id, filename=doc.filename, 
+                       mimetype=doc.mimetype,
+                       instanciation=doc.instance,
+                       title=doc.title, description=doc.description,
+                       transaction = transaction,
+                       container=False, budget=budget, journal=journal)
         status_codes += sc
-        
-        #print(docs)
-        for ix, doc in docs.iterrows():
-            
-            #r = requests.post(tx, auth=auth) # refresh transaction
-            
-            # create document
-            sc = create_document(fedoraUrl, auth, unit, did=doc['callnr'],
-                           parent=dos['id'].values[0], filename=doc['filename'], 
-                           mimetype=doc['mimetype'],
-                           instanciation=doc['instance'],
-                           title=doc['title'], description=doc['description'],
-                           transaction = None)
+
+    return status_codes
+
+def index_dossiers(client, unit, dossiers):
+    """Record loaded dossiers in the local referential node -> dossiers index"""
+    if client.index is None or not client.index.built(unit):
+        return
+    pairs = []
+    for dossier in dossiers:
+        dos = [row for row in dossier if row.type == 'dossier'][0]
+        pairs.append( (id2code(unit, dos.id), 'records/' + unit.lower() + '/' + dos.parent) )
+    client.index.set_many(unit, pairs)
+
+def load_batch(fedoraUrl, client, unit, dossiers, creator='agents/roche/66',
+               budget=None, keepalive=None, journal=None):
+    """Load dossiers, optionally all in one transaction rolled back on any failure"""
+    status_codes = []
+    if keepalive is None:
+        for dossier in dossiers:
+            sc = load_dossier(fedoraUrl, client, unit, dossier, creator=creator, budget=budget,
+                              journal=journal)
+            if all(c < 400 for c in sc):
+                index_dossiers(client, unit, [dossier])
             status_codes += sc
-    
-        # END TRANSACTION    
-        #r = requests.put(tx, auth=auth)
-        #print( 'Commit transaction:', r.status_code )
-                                                      
+        return status_codes
+
+    # writes in a transaction are journaled once it is committed
+    batch = JournalBatch(journal) if journal is not None else None
+    tx = Transaction(client, keepalive=keepalive)
+    try:
+        tx.begin()
+    except TransactionError as e:
+        print('ERROR')
+        print(e)
+        return [e.status]
+    try:
+        for dossier in dossiers:
+            status_codes += load_dossier(fedoraUrl, client, unit, dossier, creator=creator,
+                                         transaction=tx.url, budget=budget, journal=batch)
+    except Exception:
+        tx.rollback()
+        raise
+    if all(c < 400 for c in status_codes):
+        r = tx.commit()
+        if r < 400:
+            index_dossiers(client, unit, dossiers)
+            if batch is not None:
+                batch.commit()
+    else:
+        r = tx.rollback()
+        print('Rollback transaction:', tx.url, r)
+    status_codes.append(r)
     return status_codes
+
+def load_records(fedoraUrl, client, unit, creator='agents/roche/66',
+                 filename="data\\records\\records.csv",
+                 workers=1, max_inflight_bytes=256*2**20,
+                 transactions=False, dossiers_per_tx=1, keepalive=60,
+                 stream=False, chunksize=10000, resume=False):
+
+    status_codes = []
+    if filename is None:
+        filename = "data\\records\\records.csv"
+    if stream:
+        # manifest sorted by dossier, dossiers are loaded as they are read
+        dossiers = stream_dossiers(filename, chunksize=chunksize)
+    else:
+        df = pd.read_csv(filename, sep=";")
+        # empty cells as empty strings: astype(str) keeps NaN missing, and a
+        # float mimetype would be sent as Content-Type
+        df = df.fillna('')
     
+        df['id'] = df['id'].astype(str)
+        df['type'] = df['type'].astype(str)
+        df['callnr'] = df['callnr'].astype(str)
+        df['parent'] = df['parent']
+        df['title'] = df['title'].astype(str)
+        df['description'] = df['description'].astype(str)
+        df['instance'] = df['instance'].astype(str)
+        df['filename'] = df['filename'].astype(str)
+        df['fmt'] = df['fmt'].astype(str)
+        df['mimetype'] = df['mimetype'].astype(str)
+
+        dossiers = group_dossiers(df)
+    budget = ByteBudget(max_inflight_bytes)
+    if not transactions:
+        keepalive = None
+        dossiers_per_tx = 1
+
+    # completed writes are journaled; with resume, they are not redone
+    journal = open_journal(client, 'loadrecords-' + unit.lower(), resume=resume)
+
+    def load(batch):
+        return load_batch(fedoraUrl, client, unit, batch,
+                          creator=creator, budget=budget, keepalive=keepalive, journal=journal)
+
+    # batches of dossiers are independent: load them through a worker pool,
+    # each dossier keeping its own dependency order. At most two batches
+    # per worker are pending, so a streamed manifest is not read ahead.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batched(dossiers, dossiers_per_tx):
+            pending.append( pool.submit(load, batch) )
+            if len(pending) >= 2 * workers:
+                status_codes += pending.popleft().result()
+        while len(pending) > 0:
+            status_codes += pending.popleft().result()
+
+    if journal is not None:
+        journal.compact()
+        journal.close()
+    return status_codes
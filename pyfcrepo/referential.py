@@ -10,11 +10,22 @@
 # Author : Jan Krause-Bilvin
 # First release: 2022-03-03
 
-import requests
 import pandas as pd
 from . import nodes
-
+from .sync import open_sync
+from .journal import payload_hash, open_journal
+from . import diff
+from .cache import cached_get
+from . import rdf
+from . import export
+from .index import search
+from .versions import url2unit, http2memento, memento2http, memento2datetime, datetime2memento
+
+import io
+import sys
+import json
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import re
 import datetime
 
@@ -32,11 +43,90 @@ def id2code(unitCode, i, nodeType='r'):
     #return unitCode.lower() +'/'+ str(nodeType) + str(i)
     return 'records/'+ unitCode.lower() + '/referential/' + str(i)
 
+# referential CSV columns used by pyfcrepo -> normalized names
+REF_COLUMNS = {'M1': 'id',
+               'M2': 'parent_id',
+               'M3': 'cote',
+               'M4': 'title',
+               'M5': 'abstract',
+               'M13_ExternalId': 'personalData',
+               'M11_ExternalId': 'protection',
+               'M18.1_ExternalId': 'closingPeriod',
+               'M22': 'retentionPeriod'}
+# rule codes take a handful of values: stored as categoricals
+REF_CATEGORIES = ['personalData', 'protection', 'closingPeriod', 'retentionPeriod']
+
+def read_ref(filename):
+    """Read a referential CSV (M1..M44 layout) into normalized columns
+
+    Only the columns of REF_COLUMNS are parsed, as strings, and the ="..."
+    spreadsheet quoting is stripped column-wise.
+    """
+    df = pd.read_csv(filename, sep=";", usecols=list(REF_COLUMNS), dtype=str, keep_default_na=False)
+    df = df.rename(columns=REF_COLUMNS)[list(REF_COLUMNS.values())]
+    df['id'] = df['id'].astype('int64')
+    for c in list(REF_COLUMNS.values())[2:]:
+        df[c] = df[c].str.strip('"= ')
+    for c in REF_CATEGORIES:
+        df[c] = df[c].astype('category')
+    return df
+
+def ref_tree(df):
+    """children and parents maps of a referential, in one pass over its id columns"""
+    children = defaultdict(list)
+    parents  = defaultdict(list)
+    linked = df[df['parent_id'] != '-']
+    for i, p in zip(linked['id'].tolist(), linked['parent_id'].astype('int64').tolist()):
+        children[p].append(i)
+        parents[i].append(p)
+    return children, parents
+
+def node_levels(ids, parents):
+    """Group node ids by depth, roots first, keeping file order within a level"""
+    known = set(ids)
+    depth = {}
+    for i in ids:
+        path = []
+        while i not in depth:
+            path.append(i)
+            p_nodes = parents.get(i, [])
+            if len(p_nodes) == 0 or p_nodes[0] not in known or p_nodes[0] in path:
+                depth[i] = 0
+                path.pop()
+                break
+            i = p_nodes[0]
+        d = depth[i]
+        for j in reversed(path):
+            d += 1
+            depth[j] = d
+    levels = defaultdict(list)
+    for i in ids:
+        levels[depth[i]].append(i)
+    return [levels[d] for d in sorted(levels)]
+
+def put_levels(client, levels, payloads, workers=1, sync=None, journal=None):
+    """PUT payloads level by level, each level through a bounded worker pool"""
+    headers = {"Content-Type": "text/turtle"}
+    def put(i):
+        url, data = payloads[i]
+        r = client.put(url, data=data.encode('utf-8'), headers=headers)
+        if sync is not None:
+            sync.update(url, data, r)
+        if journal is not None:
+            journal.record(url, payload_hash(data), r.status_code)
+        return r.status_code
+    status_codes = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for level in levels:
+            status_codes += list(pool.map(put, level))
+    return status_codes
+
 ######################
 ## load refernetial ##
 ######################
     
-def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/66'):
+def load_ref(fedoraUrl, client, unit, unitDesc, version, filename, creator='roche/66', workers=1,
+             sync=False, resume=False, verify=False):
 
     status_codes = []       
     urlRecords = fedoraUrl + 'records/' 
@@ -53,7 +143,7 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
         description = unitDesc
     childrenStr = url + '/referential/0'
     status_codes.append( nodes.create_basic(url, 
-                                            auth, 
+                                            client, 
                                             title, 
                                             description, 
                                             children=childrenStr) )
@@ -63,7 +153,7 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
     description = 'Preservation referential.'
     childrenStr = url + '/0'
     status_codes.append( nodes.create_basic(url, 
-                                            auth, 
+                                            client, 
                                             title, 
                                             description, 
                                             children=childrenStr,
@@ -75,7 +165,7 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
     description = 'Dossiers.'
     childrenStr = url + '/0'
     status_codes.append( nodes.create_basic(url, 
-                                            auth, 
+                                            client, 
                                             title, 
                                             description, 
                                             children=childrenStr) )                                           
@@ -84,35 +174,21 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
         f = 'data/acv1.0.0.csv'
     else:
         f = filename
-    df = pd.read_csv(f, sep=";")
+    df = read_ref(f)
 
     if version is None:
         v = '1.0.0'
     else:
         v = version
 
-    df['id'] = df['M1']
-    df['parent_id'] = df['M2']
-    df['cote'] = df['M3'].apply(strip_textfield).astype(str)
-    df['title'] = df['M4'].apply(strip_textfield).astype(str)
-    df['abstract'] = df['M5'].apply(strip_textfield).astype(str)
-    df['personalData'] = df['M13_ExternalId'].apply(strip_textfield).astype(str)
-    df['protection'] = df['M11_ExternalId'].apply(strip_textfield).astype(str)
-    df['closingPeriod'] = df['M18.1_ExternalId'].apply(strip_textfield).astype(str)
-    df['retentionPeriod'] = df['M22'].apply(strip_textfield).astype(str)
+    children, parents = ref_tree(df)
 
-    children = defaultdict(list)
-    parents  = defaultdict(list)
-    for ix, row in df.iterrows():
-        if row['parent_id'] != '-':
-            children[int(row['parent_id'])].append(int(row['id']))
-            parents[int(row['id'])].append(int(row['parent_id']))
-
-    for ix, row in df.iterrows():
-        url = fedoraUrl + id2code(unit.lower(), row['id'] )
+    payloads = {}
+    for row in df.itertuples(index=False):
+        url = fedoraUrl + id2code(unit.lower(), row.id )
 
         # compute parent node
-        p_nodes = parents[row['id']]
+        p_nodes = parents[row.id]
         if len(p_nodes) == 1:
             if str(p_nodes[0]) != '-':
                 node_parent = '<' + fedoraUrl + id2code(unit.lower(), p_nodes[0]) + '>'
@@ -122,7 +198,7 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
             node_parent = '<' + urlRecords + unit.lower() + '>'
         
         # compute children node
-        node_children = [ '<'+fedoraUrl+id2code(unit.lower(), i)+'>' for i in children[row['id']] ]
+        node_children = [ '<'+fedoraUrl+id2code(unit.lower(), i)+'>' for i in children[row.id] ]
         children_str = ', '.join(node_children)
         if not children_str == '':
             parts = '<>  rico:hasOrHadPart ' + children_str + ' .' 
@@ -130,7 +206,7 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
             parts = ''
             
         # compute recordSetType
-        if len(children[row['id']]) > 0:
+        if len(children[row.id]) > 0:
             recordSetType = typesUrl+'/referential'
         else:
             recordSetType = typesUrl+'/referentialLeaf'
@@ -139,9 +215,9 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
         recordState = fedoraUrl + 'states/open' 
         
         # compute rules
-        rP = rulesUrl +'/retentionPeriod' + str(row['retentionPeriod'] +'A')
-        cP = rulesUrl +'/closingPeriod'   + str(row['closingPeriod'])
-        dP = rulesUrl +'/protection'   + str(row['protection'])
+        rP = rulesUrl +'/retentionPeriod' + str(row.retentionPeriod +'A')
+        cP = rulesUrl +'/closingPeriod'   + str(row.closingPeriod)
+        dP = rulesUrl +'/protection'   + str(row.protection)
         rules = '<{cP}>, <{rP}> , <{dP}>'.format(cP=cP, rP=rP, dP=dP)
         
         # create rico turtle
@@ -158,24 +234,54 @@ def load_ref(fedoraUrl, auth, unit, unitDesc, version, filename, creator='roche/
                    <>  rico:isOrWasRegulatedBy {rules}.
                    <>  premis:version '{archivalVersion}'.
                    {parts}
-               """.format( title=row['title'].replace("'", "\\'"), 
-                           abstract=row['abstract'].replace("'", "\\'"), 
+               """.format( title=row.title.replace("'", "\\'"), 
+                           abstract=row.abstract.replace("'", "\\'"), 
                            creator=creatorUrl,
                            parent=node_parent,
                            parts=parts,
                            state=recordState,
-                           identifier=row['cote'],
+                           identifier=row.cote,
                            recSetType=recordSetType,
                            archivalVersion=v,
                            rules=rules)
-        
-        # send request to api
-        r = requests.put(url, auth=auth, data=data.encode('utf-8'), headers=headers)
-        status_codes.append(r.status_code)
-
+        payloads[row.id] = (url, data)
+
+    # only write new or changed nodes
+    state = open_sync(client, sync, verify=verify)
+    if state is not None:
+        # the root node carries the version label, it is always written
+        payloads = {i: p for i, p in payloads.items() if i == 0 or state.changed(*p)}
+
+    # completed writes are journaled; with resume, they are not redone
+    journal = open_journal(client, 'loadref-' + unit.lower(), resume=resume)
+    if journal is not None:
+        payloads = {i: p for i, p in payloads.items() if not journal.done(p[0], payload_hash(p[1]))}
+
+    # send requests to api: in file order, or level by level so that
+    # parents exist before their children
+    if workers > 1:
+        ids = list(payloads.keys())
+        status_codes += put_levels(client, node_levels(ids, parents), payloads, workers=workers, sync=state,
+                                   journal=journal)
+    else:
+        for url, data in payloads.values():
+            r = client.put(url, data=data.encode('utf-8'), headers=headers)
+            if state is not None:
+                state.update(url, data, r)
+            if journal is not None:
+                journal.record(url, payload_hash(data), r.status_code)
+            status_codes.append(r.status_code)
+
+    if state is not None:
+        state.save()
+    if journal is not None:
+        journal.compact()
+        journal.close()
+    record_version(fedoraUrl, client, unit, v)
     return status_codes
 
-def update_ref(fedoraUrl, auth, unit, version, filename, filename_old, creator='roche66'):
+def update_ref(fedoraUrl, client, unit, version, filename, filename_old, creator='roche/66', sync=False,
+               dry_run=False, plan=None, verify=False):
 
     status_codes = []       
     urlRecords = fedoraUrl + 'records/' 
@@ -183,56 +289,41 @@ def update_ref(fedoraUrl, auth, unit, version, filename, filename_old, creator='
     rulesUrl = fedoraUrl + 'rules'
     creatorUrl = fedoraUrl + 'agents/' + creator
     
-    df = pd.read_csv(filename_old, sep=";")
-    df['id'] = df['M1']
-    df['parent_id'] = df['M2']
-    df['cote'] = df['M3'].apply(strip_textfield).astype(str)
-    df['title'] = df['M4'].apply(strip_textfield).astype(str)
-    df['abstract'] = df['M5'].apply(strip_textfield).astype(str)
-    df['personalData'] = df['M13_ExternalId'].apply(strip_textfield).astype(str)
-    df['protection'] = df['M11_ExternalId'].apply(strip_textfield).astype(str)
-    df['closingPeriod'] = df['M18.1_ExternalId'].apply(strip_textfield).astype(str)
-    df['retentionPeriod'] = df['M22'].apply(strip_textfield).astype(str)
-
-    df2 = pd.read_csv(filename, sep=";")
-    df2['id'] = df2['M1']
-    df2['parent_id'] = df2['M2']
-    df2['cote'] = df2['M3'].apply(strip_textfield).astype(str)
-    df2['title'] = df2['M4'].apply(strip_textfield).astype(str)
-    df2['abstract'] = df2['M5'].apply(strip_textfield).astype(str)
-    df2['personalData'] = df2['M13_ExternalId'].apply(strip_textfield).astype(str)
-    df2['protection'] = df2['M11_ExternalId'].apply(strip_textfield).astype(str)
-    df2['closingPeriod'] = df2['M18.1_ExternalId'].apply(strip_textfield).astype(str)
-    df2['retentionPeriod'] = df2['M22'].apply(strip_textfield).astype(str) 
+    df = read_ref(filename_old)
+    df2 = read_ref(filename)
 
-    children = defaultdict(list)
-    parents  = defaultdict(list)
-    for ix, row in df2.iterrows():
-        if row['parent_id'] != '-':
-            children[int(row['parent_id'])].append(int(row['id']))
-            parents[int(row['id'])].append(int(row['parent_id']))
+    children, parents = ref_tree(df2)
             
-    # which ids have been deleted?
-    ids1 = list(df['id'])
-    ids2 = list(df2['id'])
-    deleted = list( set(ids1) - set(ids2) )
-
-    for ix, row in df2.iterrows():
-        url = fedoraUrl + id2code(unit.lower(), row['id'] )
+    # which ids have been created, deleted, renamed, moved...?
+    changes = diff.diff_ref(df, df2)
+    if plan is not None:
+        diff.write_plan(changes, plan)
+    print(diff.report(changes))
+    if dry_run:
+        return diff.plan2json(changes)
+    deleted = set( diff.to_close(changes) )
+    # the root node carries the version label, it is always written
+    write = set( diff.to_write(changes) ) | {0}
+
+    state = open_sync(client, sync, verify=verify)
+    for row in df2.itertuples(index=False):
+        if row.id not in write:
+            continue
+        url = fedoraUrl + id2code(unit.lower(), row.id )
         #print(url)
         
         # compute parent node
-        p_nodes = parents[row['id']]
+        p_nodes = parents[row.id]
         if len(p_nodes) == 1:
             if str(p_nodes[0]) != '-':
                 node_parent = '<' + fedoraUrl + id2code(unit.lower(), p_nodes[0]) + '>'
             else:
-                node_parent = '<' + fedoraUrl + unitCode.lower() + '>'
+                node_parent = '<' + urlRecords + unit.lower() + '>'
         else:
-            node_parent = '<' + fedoraUrl + unit.lower() + '>'
+            node_parent = '<' + urlRecords + unit.lower() + '>'
         
         # compute children node
-        node_children = [ '<'+fedoraUrl+id2code(unit.lower(), i)+'>' for i in children[row['id']] ]
+        node_children = [ '<'+fedoraUrl+id2code(unit.lower(), i)+'>' for i in children[row.id] ]
         children_str = ', '.join(node_children)
         if not children_str == '':
             parts = '<>  rico:hasOrHadPart ' + children_str + ' .' 
@@ -240,21 +331,21 @@ def update_ref(fedoraUrl, auth, unit, version, filename, filename_old, creator='
             parts = ''
             
         # compute recordSetType
-        if len(children[row['id']]) > 0:
+        if len(children[row.id]) > 0:
             recordSetType = typesUrl+'/referential'
         else:
             recordSetType = typesUrl+'/referentialLeaf'
             
         # comput record state
-        if int(row['id']) in deleted:
+        if row.id in deleted:
             recordState = fedoraUrl + 'states/closed' 
         else:
             recordState = fedoraUrl + 'states/open' 
         
         # compute rules
-        rP = rulesUrl +'/retentionPeriod' + str(row['retentionPeriod'] +'A')
-        cP = rulesUrl +'/closingPeriod'   + str(row['closingPeriod'])
-        dP = rulesUrl +'/protection'   + str(row['protection'])
+        rP = rulesUrl +'/retentionPeriod' + str(row.retentionPeriod +'A')
+        cP = rulesUrl +'/closingPeriod'   + str(row.closingPeriod)
+        dP = rulesUrl +'/protection'   + str(row.protection)
         rules = '<{cP}>, <{rP}> , <{dP}>'.format(cP=cP, rP=rP, dP=dP)
         
         # create rico turtle
@@ -271,90 +362,149 @@ def update_ref(fedoraUrl, auth, unit, version, filename, filename_old, creator='
                    <>  rico:isOrWasRegulatedBy {rules}.
                    <>  premis:version '{archivalVersion}'.
                    {parts}
-               """.format( title=row['title'].replace("'", "\\'"), 
-                           abstract=row['abstract'].replace("'", "\\'"), 
+               """.format( title=row.title.replace("'", "\\'"), 
+                           abstract=row.abstract.replace("'", "\\'"), 
                            creator=creatorUrl,
                            parent=node_parent,
                            parts=parts,
                            state=recordState,
-                           identifier=row['cote'],
+                           identifier=row.cote,
                            recSetType=recordSetType,
                            archivalVersion=version,
                            rules=rules)
         
-        r = requests.put(url, auth=auth, data=data.encode('utf-8'), headers=headers)
-        #print('records/acv/'+str(row['id']), r.status_code)
+        if state is not None and row.id != 0 and not state.changed(url, data):
+            continue
+        r = client.put(url, data=data.encode('utf-8'), headers=headers)
+        if state is not None:
+            state.update(url, data, r)
+        status_codes.append(r.status_code)
 
     # Process deleted records : change state to closed
 
     for rid in deleted:
         url = fedoraUrl + id2code(unit.lower(), rid )
-        #print(url)
+        status_codes.append( nodes.update_node(url, client, close_change(fedoraUrl))[0] )
 
-        newTriple = """<{url}>  rico:hasRecordState <http://localhost:8080/rest/states/closed> .  
-                    """.format(url=url)
-
-        r =  requests.get(url, auth=auth)
-        if r.status_code == 200:
-            data = r.text
-            datas = data.split('\n')
-            data2 = ''
-            for s in datas:
-                if not (('rdf:type' in s) or ('fedora:' in s) or 
-                        ('ldp:contains' in s) or ('rico:hasRecordState' in s) ):
-                        data2 += '\n' + s
-            data2 = data2.strip(' \n')
-
-            if data2[-1] == ';':
-                data2 = data2[:-1] + '.'
-            data2 += '\n' + newTriple
-            data2 = '@prefix rico: <https://www.ica.org/standards/RiC/ontology#> .\n@prefix premis: <http://id.loc.gov/vocabulary/preservation/> .\n' + data2
-
-        else:
-            print('ERROR')
-            print(r.status_code)
-            print(r.text)
+    if state is not None:
+        state.save()
+    record_version(fedoraUrl, client, unit, version)
+    return status_codes
 
-        #print(data2)
-        r = requests.put(url, auth=auth, data=data2.encode('utf-8'), headers=headers)
-        print(r.status_code)
+def parse_response(r, url):
+    """Node record of a response, N-Triples when the server honoured the Accept header"""
+    if r.headers.get('Content-Type', '').startswith(rdf.NTRIPLES):
+        return rdf.node_record(r.text, url)
+    return parse_node(r.text, url)
+
+def parse_node(data, url):
+    """Parse title, callnr, version, parent, children, abstract and rules from a turtle node representation"""
+    out = {'url':url, 'title':'None', 'callnr':'X', 'version':'None', 'children':[]}
+    for l in data.split('\n'):
+        if '<https://www.ica.org/standards/RiC/ontology#title>' in l:
+            l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#title>','').strip(' \t\n.;<>"')
+            out['title'] = l2
+        elif '<https://www.ica.org/standards/RiC/ontology#hasOrHadIdentifier>' in l:
+            l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#hasOrHadIdentifier>','').strip(' \t\n.;<>"')
+            out['callnr'] = l2
+        elif '<http://id.loc.gov/vocabulary/preservation/version>' in l:
+            l2 = l.replace('<http://id.loc.gov/vocabulary/preservation/version>','').strip(' \t\n.;<>"')
+            out['version'] = l2
+        elif '<https://www.ica.org/standards/RiC/ontology#isOrWasPartOf>' in l:
+            l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#isOrWasPartOf>','').strip(' \t\n.;<>"')
+            out['parent_id'] = l2
+        elif '<https://www.ica.org/standards/RiC/ontology#hasOrHadPart>' in l:
+            l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#hasOrHadPart>','').strip(' \t\n.;<>')
+            out['children'].append(l2)
+        elif '<https://www.ica.org/standards/RiC/ontology#scopeAndContent>' in l:
+            l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#scopeAndContent>','').strip(' \t\n.;<>"')
+            out['abstract'] = l2
+        elif '<https://www.ica.org/standards/RiC/ontology#isOrWasRegulatedBy>' in l:
+            l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#isOrWasRegulatedBy>','')
+            out.setdefault('rules', []).extend(re.findall('<([^>]*)>', l2))
+    return out
 
-def get_metadata(url, auth, version=None):
-    if version == None:
-        r =  requests.get(url, auth=auth)
+def version_memento(url, client, version):
+    """Memento id of version for the referential of url, or None
+
+    A label missing from the version index (another host, an existing
+    repository, a wiped state_dir) rebuilds the index of the unit from the
+    repository, once per process.
+    """
+    unit = url2unit(url)
+    if unit is None:
+        return None
+    memento = client.versions.lookup(unit, version)
+    if memento is None:
+        with client.versions.rebuild_lock:
+            memento = client.versions.lookup(unit, version)
+            if memento is None and unit not in client.versions.rebuilt:
+                client.versions.rebuilt.add(unit)
+                fedoraUrl = url[:url.index(id2code(unit, 0).rsplit('/', 1)[0])]
+                memento = rebuild_version_index(fedoraUrl, client, unit).get(version)
+    return memento
+
+def get_node(url, client, version=None):
+    """Fetch a node once: title, callnr, version, parent_id and children"""
+    def parse(r):
+        return parse_response(r, url)
+    headers = rdf.node_headers()
+    if version is None:
+        md = cached_get(client, url, parse, headers=headers)
     else:
-        versions = get_versions(url, auth)
-        vv = None
-        for ver in versions:
-            v = get_metadata(ver, auth)['version']
-            if v == version:
-                vv=ver
-                break
-        r =  requests.get(vv, auth=auth)
-    
-    out = {'url':url, 'title':'None', 'callnr':'X', 'version':'None'}
-    if r.status_code == 200:
-        data = r.text
-        for l in data.split('\n'):
-            if '<https://www.ica.org/standards/RiC/ontology#title>' in l:
-                l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#title>','').strip(' \t\n.;<>"')
-                out['title'] = l2
-            elif '<https://www.ica.org/standards/RiC/ontology#hasOrHadIdentifier>' in l:
-                l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#hasOrHadIdentifier>','').strip(' \t\n.;<>"')
-                out['callnr'] = l2
-            elif '<http://id.loc.gov/vocabulary/preservation/version>' in l:
-                l2 = l.replace('<http://id.loc.gov/vocabulary/preservation/version>','').strip(' \t\n.;<>"')
-                out['version'] = l2
-            elif '<https://www.ica.org/standards/RiC/ontology#isOrWasPartOf>' in l:
-                l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#isOrWasPartOf>','').strip(' \t\n.;<>"')
-                out['parent_id'] = l2
+        memento = version_memento(url, client, version)
+        md = None
+        if memento is not None:
+            # mementos never change: cached without revalidation
+            headers['Accept-Datetime'] = memento2http(memento)
+            md = cached_get(client, url, parse, key=url + '@' + memento, immutable=True, headers=headers)
+    if md is None:
+        return {'url':url, 'title':'None', 'callnr':'X', 'version':'None', 'children':[]}
+    return md
+
+def record_version(fedoraUrl, client, unit, version):
+    """Record the memento time at which version of the unit referential is complete"""
+    r = client.head(fedoraUrl + id2code(unit.lower(), 0))
+    if 'Date' in r.headers:
+        memento = http2memento(r.headers['Date'])
     else:
-        pass
-        #print('ERROR')
-    return out
+        memento = datetime2memento(datetime.datetime.now(datetime.timezone.utc))
+    client.versions.record(unit, version, memento)
+    return memento
+
+def rebuild_version_index(fedoraUrl, client, unit):
+    """Rebuild the version index of a unit from the mementos of its referential root
+
+    Every load writes the root node first, so a version lasts until the
+    first root memento of the next version.
+    """
+    url = fedoraUrl + id2code(unit.lower(), 0)
+    labels = []
+    for v in sorted( get_versions(url, client) ):
+        r = client.get(v, headers=rdf.node_headers())
+        if r.status_code == 200:
+            label = parse_response(r, url)['version']
+            if len(labels) == 0 or labels[-1][0] != label:
+                labels.append( (label, v.split('/')[-1]) )
+    index = {}
+    for (label, start), (nextLabel, nextStart) in zip(labels, labels[1:]):
+        end = memento2datetime(nextStart) - datetime.timedelta(seconds=1)
+        index[label] = datetime2memento(end)
+    if len(labels) > 0:
+        r = client.head(url)
+        if 'Date' in r.headers:
+            index[labels[-1][0]] = http2memento(r.headers['Date'])
+        else:
+            index[labels[-1][0]] = datetime2memento(datetime.datetime.now(datetime.timezone.utc))
+    client.versions.replace(unit, index)
+    return index
+
+def get_metadata(url, client, version=None):
+    return get_node(url, client, version=version)
     
-def get_versions(url, auth):
-    r = requests.get(url + '/fcr:versions', auth=auth)
+def parse_versions(r):
+    if r.headers.get('Content-Type', '').startswith(rdf.NTRIPLES):
+        return [o for o in rdf.objects(r.text, rdf.LDP + 'contains') if '/fcr:versions/' in o]
     versions_ttl = r.text
     versions = []
     for t in re.findall('((?=<)(?!<\/)<)(.*?)((?= \/>)|(?=>))', versions_ttl):
@@ -362,89 +512,67 @@ def get_versions(url, auth):
             versions.append( t[1] ) # .split('/')[-1]
     return versions
 
+def get_versions(url, client):
+    versions = cached_get(client, url + '/fcr:versions', parse_versions,
+                          headers={'Accept': rdf.NTRIPLES})
+    if versions is None:
+        return []
+    return versions
+
 def get_current_version(versions):
     return sorted(versions)[-1]  
     
-def get_children(url, auth, version=None):
-    if version is None:
-        r =  requests.get(url, auth=auth)
-    else:
-        versions = sorted( get_versions(url, auth=auth) )
-        ver = None
-        for v in versions:
-            md = get_metadata(v, auth)
-            #print(md)
-            if md['version'] == version:
-                ver = v
-        #if ver == None:
-        #    ver =  versions[0]
-        r =  requests.get(ver, auth=auth)
-    children = []
-    if r.status_code == 200:
-        data = r.text
-        for l in data.split('\n'):
-            if '<https://www.ica.org/standards/RiC/ontology#hasOrHadPart>' in l:
-                l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#hasOrHadPart>','').strip(' \t\n.;<>')
-                children.append(l2)
-    else:
-        print('ERROR')
-    return children
-
-def get_children_lastVersion(url, auth):
-    r =  requests.get(url, auth=auth)
-    children = []
-    if r.status_code == 200:
-        data = r.text
-        for l in data.split('\n'):
-            if '<https://www.ica.org/standards/RiC/ontology#hasOrHadPart>' in l:
-                l2 = l.replace('<https://www.ica.org/standards/RiC/ontology#hasOrHadPart>','').strip(' \t\n.;<>')
-                children.append(l2)
-    else:
-        print('ERROR')
-    return children
-    
-def traverse(url, auth, version=None):
-    """Sorted tree traversal with version filtering"""
-    def get_callnr(x):
-        return x['callnr']
-    tree = []
-    children = get_children(url, auth, version=version)
-    if isinstance(children, list):
-        #FIXME: add version to get metadata
-        children_md = [get_metadata(u, auth, version=version) for u in children]
-        children_md_sorted = sorted( children_md, key=get_callnr )
-        for x in children_md_sorted : 
-            tree.append(x)
-            tree2 = traverse(x['url'], auth, version=version)
-            if len(tree2) > 0 :
-                tree.append( [tree2] )
-    return tree
-    
-def traverse_sorted(url, auth):
-    """Sorted tree traversal"""
-    def get_callnr(x):
-        return x['callnr']
+def get_children(url, client, version=None):
+    return get_node(url, client, version=version)['children']
+
+def get_children_lastVersion(url, client):
+    return get_node(url, client)['children']
+
+def get_callnr(x):
+    return x['callnr']
+
+def traverse_node(node, client, version=None, key=get_callnr):
+    """Depth-first traversal below an already fetched node"""
     tree = []
-    children = get_children(url, auth)
-    children_md = [get_metadata(u, auth) for u in children]
-    children_md_sorted = sorted( children_md, key=get_callnr )
-    for x in children_md_sorted : 
+    children_md = [get_node(u, client, version=version) for u in node['children']]
+    if key is not None:
+        children_md = sorted( children_md, key=key )
+    for x in children_md : 
         tree.append(x)
-        tree2 = traverse(x['url'], auth)
+        tree2 = traverse_node(x, client, version=version, key=key)
         if len(tree2) > 0 :
             tree.append( [tree2] )
     return tree
     
-def traverse_unsorted(url, auth):
+def traverse(url, client, version=None, workers=1):
+    """Sorted tree traversal with version filtering
+
+    Builds the nested structure of traverse_node from walk: every node
+    dict is followed by [subtree] when it has children.
+    """
+    # subtrees being built, one per depth below url
+    stack = [[]]
+    for depth, md in walk(url, client, version=version, workers=workers):
+        if depth == 0:
+            continue
+        while len(stack) > depth:
+            subtree = stack.pop()
+            stack[-1].append( [subtree] )
+        if len(stack) < depth:
+            stack.append([])
+        stack[-1].append(md)
+    while len(stack) > 1:
+        subtree = stack.pop()
+        stack[-1].append( [subtree] )
+    return stack[0]
+    
+def traverse_sorted(url, client):
+    """Sorted tree traversal"""
+    return traverse_node(get_node(url, client), client)
+    
+def traverse_unsorted(url, client):
     """Unsorted tree traveral"""
-    tree = []
-    for x in get_children(url, auth) : 
-        md = get_metadata(x, auth)
-        tree.append(md)
-        tree2 = traverse(x, auth)
-        if len(tree2) > 0 :
-            tree.append( [tree2] )
-    return tree
+    return traverse_node(get_node(url, client), client, key=None)
 
 def tree2html(tree):
     html = ''
@@ -456,91 +584,134 @@ def tree2html(tree):
             html += '\n<ul>' + html2 + '</ul>\n'
     return html
     
-def traverse_html(url, auth, version=None):
-    html = '<html>\n'
-    html += '''<style>
-                       ul {list-style: none;}
-                       a { text-decoration: none;}
-            </style>'''
-    html += '<body>\n'
-    html += '<h3> Tree </h3>\n'
-    if version is not None:
-        html +='version {version}'.format(version=version)
-    html += '<ul class="collapsibleList">\n' 
-    html += tree2html( traverse(url, auth, version=version) )
-    html += '</ul>\n'
-    html += '\n<script type="text/javascript">CollapsibleLists.apply();</script>\n'
-    html += '</body>\n'
-    html += '</html>'
-    return html
+def walk(url, client, version=None, workers=1, key=get_callnr):
+    """Depth-first stream of (depth, node) below url, the node at url first at depth 0
+
+    Siblings are sorted by key. The children of a group of siblings are
+    fetched in the background while the first of them is streamed, so at
+    most two levels of siblings per depth are held in memory.
+    """
+    def fetch(u):
+        return get_node(u, client, version=version)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def expand(md):
+            return [pool.submit(fetch, u) for u in md['children']]
+
+        def visit(futures, depth):
+            mds = [f.result() for f in futures]
+            if key is not None:
+                mds = sorted(mds, key=key)
+            pending = [expand(md) for md in mds]
+            for md, children in zip(mds, pending):
+                yield depth, md
+                yield from visit(children, depth + 1)
+
+        root = fetch(url)
+        yield 0, root
+        yield from visit(expand(root), 1)
+
+def export_tree(url, client, out, fmt='html', version=None, workers=1):
+    """Write the tree below url to the open text file out, node by node"""
+    writer = export.FORMATS[fmt](out, version=version)
+    for depth, md in walk(url, client, version=version, workers=workers):
+        writer.write(depth, md)
+    writer.close()
+
+def traverse_html(url, client, version=None, workers=1):
+    out = io.StringIO()
+    export_tree(url, client, out, fmt='html', version=version, workers=workers)
+    return out.getvalue()
         
-def dump_ref(fedoraUrl, auth, unit, version, filename):
-    urlRecords = fedoraUrl + 'records/' 
-    typesUrl = fedoraUrl + 'types'
-    rulesUrl = fedoraUrl + 'rules'
-    
+def dump_ref(fedoraUrl, client, unit, version, filename, workers=1, fmt='html'):
+    """Export the referential of a unit as html, json, ndjson or csv, streamed into filename (- for stdout)"""
     url = fedoraUrl + id2code(unit.lower(), 0 )
-    html = traverse_html(url, auth, version=version) 
-    open(filename, 'w').write( html )    
-
-def list_records(fedoraUrl, auth, unit, refid):
-    url = fedoraUrl + 'fcr:search?condition=fedora_id%3Drecords%2F{unit}%2Fdossiers%2F*'.format(unit=unit.lower())
-    #print(url)
-    r = requests.get(url, auth=auth)
-    r = r.json()
-    #print(r['items'])
-    ids = []
-    for x in r['items']:
-        #if 'records/'+unit.lower()+'dossiers/D' in x:
-            x2 = x['fedora_id'].replace(fedoraUrl+'records/' , '')
-            #print(x2)
-            x3 = x2.split('/')[:3]
-            x4 = fedoraUrl+'records/' + '/'.join(x3)      
-            ids.append(x4)
-    ids = list(set(ids))
-    #print(ids)
-    ids2 = []
-    for x in ids:
-        md = get_metadata(x, auth)
-        #print(x)
-        #print(md)
-        if 'parent_id' in md.keys():
-            if md['parent_id'].endswith(unit.lower()+'/referential/'+str(refid)):
-                ids2.append(x)
-    return ids2
+    if filename == '-':
+        export_tree(url, client, sys.stdout, fmt=fmt, version=version, workers=workers)
+        return
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        export_tree(url, client, f, fmt=fmt, version=version, workers=workers)
+
+def list_dossiers(fedoraUrl, client, unit):
+    """Stream the urls of the dossiers of a unit, paging through fcr:search"""
+    prefix = fedoraUrl + 'records/'
+    seen = set()
+    condition = 'fedora_id=records/{unit}/dossiers/*'.format(unit=unit.lower())
+    for x in search(client, condition, fields='fedora_id'):
+        # documents, instantiations and binaries collapse onto their dossier
+        x3 = x['fedora_id'].replace(prefix, '').split('/')[:3]
+        if len(x3) < 3:
+            continue
+        x4 = prefix + '/'.join(x3)
+        if x4 not in seen:
+            seen.add(x4)
+            yield x4
+
+def relative(fedoraUrl, url):
+    if url.startswith(fedoraUrl):
+        return url[len(fedoraUrl):]
+    return url
+
+def index_records(fedoraUrl, client, unit, workers=1):
+    """Rebuild the referential node -> dossiers index of a unit from the repository"""
+    client.index.clear(unit)
+    pairs = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for md in pool.map(lambda x: get_node(x, client), list_dossiers(fedoraUrl, client, unit)):
+            if 'parent_id' in md.keys():
+                pairs.append( (relative(fedoraUrl, md['url']), relative(fedoraUrl, md['parent_id'])) )
+    client.index.set_many(unit, pairs)
+    client.index.mark_built(unit)
+    return len(pairs)
+
+def list_records(fedoraUrl, client, unit, refid, refresh=False, workers=1):
+    """Dossiers attached to a referential node, answered from the local index
+
+    The index is built from the repository the first time (or with
+    refresh), then kept up to date by load_records and move_record.
+    """
+    parent = id2code(unit.lower(), refid)
+    if client.index is None:
+        ids2 = []
+        for x in list_dossiers(fedoraUrl, client, unit):
+            md = get_node(x, client)
+            if 'parent_id' in md.keys():
+                if md['parent_id'].endswith(parent):
+                    ids2.append(x)
+        return ids2
+    if refresh or not client.index.built(unit):
+        index_records(fedoraUrl, client, unit, workers=workers)
+    return [fedoraUrl + x for x in client.index.dossiers(unit, parent)]
     
-def close_record(fedoraUrl, auth, unit, refid):
+def close_change(fedoraUrl, add=None):
+    """nodes.update_node change setting the closed state, None for a node already closed"""
+    closed = fedoraUrl + 'states/closed'
+    def change(text):
+        if closed in rdf.objects(text, rdf.RICO + 'hasRecordState'):
+            return None
+        return {'hasRecordState': nodes.iri(closed)}, add
+    return change
+
+def close_record(fedoraUrl, client, unit, refid):
     urlDossier = fedoraUrl + 'records/{unit}/dossiers/{id}'.format(unit=unit.lower(), id=refid)
-    r =  requests.get(urlDossier, auth=auth)
-    if r.status_code == 200:
-        eventsUrl = urlDossier + '/events'
-        headers = {"Content-Type": "text/turtle"}
-        data = """ <>  rico:title 'Dossier events'.
-                   """
-        r2 = requests.put(eventsUrl, auth=auth, data=data.encode('utf-8'), headers=headers)
-
-        eventsUrl = urlDossier + '/events/e1'
-
-        # Update dossier
-        newTriple = """<{urlDossier}>  rico:isAffectedBy <{eventsUrl}>  .
-                       <{urlDossier}>  rico:hasRecordState <http://localhost:8080/rest/states/closed> .  
-                    """.format(urlDossier=urlDossier,eventsUrl=eventsUrl)
-        data = r.text
-        datas = data.split('\n')
-        data2 = ''
-        for s in datas:
-            if not (('rdf:type' in s) or ('fedora:' in s) or 
-                    ('ldp:contains' in s) or ('rico:hasRecordState' in s) ):
-                    data2 += '\n' + s
-        data2 = data2.strip(' \n')
-
-        if data2[-1] == ';':
-            data2 = data2[:-1] + '.'
-        data2 += '\n' + newTriple
-        
-    r = requests.put(urlDossier, auth=auth, data=data2.encode('utf-8'), headers=headers)
+    eventsUrl = urlDossier + '/events/e1'
+
+    # Update dossier, unless already closed
+    sc, changed = nodes.update_node(urlDossier, client,
+                                    close_change(fedoraUrl, add=[('isAffectedBy', nodes.iri(eventsUrl))]))
+    if sc >= 400:
+        print('ERROR')
+        print(sc)
+        return sc
+    if not changed:
+        return sc
+
+    headers = {"Content-Type": "text/turtle"}
+    data = """ <>  rico:title 'Dossier events'.
+               """
+    r2 = client.put(urlDossier + '/events', data=data.encode('utf-8'), headers=headers)
 
-    currentVersion = get_current_version( get_versions(urlDossier, auth))
+    currentVersion = get_current_version( get_versions(urlDossier, client))
 
     normalizedDate = datetime.datetime.now().strftime('%Y-%m-%d')
 
@@ -557,47 +728,105 @@ def close_record(fedoraUrl, auth, unit, refid):
                <> rico:affects <{dossierUrl}> .
                """.format( dossierUrl=dossierUrl, normalizedDate=normalizedDate )
 
-    r = requests.put(eventsUrl, auth=auth, data=data.encode('utf-8'), headers=headers)
+    r = client.put(eventsUrl, data=data.encode('utf-8'), headers=headers)
     return r.status_code
     
-def move_record(fedoraUrl, auth, unit, id, target_refid):
-    urlDossier = fedoraUrl + 'records/{unit}/dossiers/{id}'.format(unit=unit.lower(), id=id)
-    recordUri  = urlDossier
-    newParent  = fedoraUrl + 'records/{unit}/referential/{id}'.format(unit=unit.lower(), id=target_refid)
-    newId      = get_metadata(newParent, auth)['callnr']
+def move_target(fedoraUrl, client, unit, refid):
+    """Url and call number of a referential node dossiers are moved to, None if it does not exist"""
+    newParent = fedoraUrl + 'records/{unit}/referential/{id}'.format(unit=unit.lower(), id=refid)
+    md = get_node(newParent, client)
+    if 'parent_id' not in md.keys():
+        return None
+    newId = md['callnr']
     if '/' in newId:
-        newId = newId.split('/')[-1]    
-    print(newId)
-    r =  requests.get(urlDossier, auth=auth)
-
-    if r.status_code == 200:
-
+        newId = newId.split('/')[-1]
+    return newParent, newId
 
-        newTriple = """<{urlDossier}>  rico:isOrWasPartOf <{newParent}> .
-                       <{urlDossier}>  rico:hasOrHadIdentifier  '{newId}' .
-                    """.format(urlDossier=urlDossier,newParent=newParent, newId=newId)
-
-        data = r.text
-        datas = data.split('\n')
-        data2 = ''
-        for s in datas:
-            if not (('rdf:type' in s) or ('fedora:' in s) or 
-                    ('ldp:contains' in s) or ('isOrWasPartOf' in s) or
-                    ('hasOrHadIdentifier' in s) ):
-                    data2 += '\n' + s
-        data2 = data2.strip(' \n')
+def move_record(fedoraUrl, client, unit, id, target_refid, target=None):
+    urlDossier = fedoraUrl + 'records/{unit}/dossiers/{id}'.format(unit=unit.lower(), id=id)
+    if target is None:
+        target = move_target(fedoraUrl, client, unit, target_refid)
+        if target is None:
+            print('ERROR')
+            print('No referential node', target_refid)
+            return 404
+        print(target[1])
+    newParent, newId = target
+
+    def change(text):
+        md = rdf.node_record(text, urlDossier)
+        if md.get('parent_id') == newParent and md['callnr'] == newId:
+            return None
+        return {'isOrWasPartOf': nodes.iri(newParent), 'hasOrHadIdentifier': nodes.literal(newId)}, []
+
+    sc, changed = nodes.update_node(urlDossier, client, change)
+    if sc >= 400:
+        print('ERROR')
+        print(sc)
+    elif client.index is not None and client.index.built(unit):
+        client.index.set(unit, relative(fedoraUrl, urlDossier), relative(fedoraUrl, newParent))
+    return sc
+
+def read_dossier_list(filename):
+    """Dossiers of a bulk action, from a ;-separated CSV file or NDJSON (.ndjson, .jsonl) with dosid and refid fields
+
+    refid, the target referential node, is only needed by moverecords.
+    """
+    if filename.endswith('.ndjson') or filename.endswith('.jsonl'):
+        with open(filename, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip() != '']
+    else:
+        df = pd.read_csv(filename, sep=';', dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        rows = df.to_dict('records')
+    out = []
+    for row in rows:
+        refid = row.get('refid')
+        out.append({'dosid': str(row['dosid']).strip(),
+                    'refid': str(refid).strip() if refid not in (None, '') else None})
+    return out
 
-        if data2[-1] == ';':
-            data2 = data2[:-1] + '.'
-        data2 += '\n' + newTriple
-        data2 = '@prefix rico: <https://www.ica.org/standards/RiC/ontology#> .\n@prefix premis: <http://id.loc.gov/vocabulary/preservation/> .\n' + data2
+def plan_dossier_list(fedoraUrl, client, unit, filename, change):
+    """Dossiers attached to the nodes having a given change in an updateref plan (see diff.write_plan)"""
+    with open(filename, encoding='utf-8') as f:
+        plan = json.load(f)
+    out = []
+    for entry in plan:
+        if change in entry['changes']:
+            for url in list_records(fedoraUrl, client, unit, entry['id']):
+                out.append({'dosid': url.split('/')[-1], 'refid': str(entry['id'])})
+    return out
 
-        
+def close_records(fedoraUrl, client, unit, dossiers, workers=1):
+    """Close many dossiers concurrently, returns the status of each one"""
+    def close(d):
+        return dict(d, status=close_record(fedoraUrl, client, unit, d['dosid']))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(close, dossiers))
+
+def move_records(fedoraUrl, client, unit, dossiers, workers=1):
+    """Move many dossiers concurrently, returns the status of each one
+
+    Every distinct target node is fetched once; dossiers whose target does
+    not exist get status 404 without any request.
+    """
+    refids = sorted(set(d['refid'] for d in dossiers if d['refid'] is not None))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        targets = dict(zip(refids, pool.map(lambda x: move_target(fedoraUrl, client, unit, x), refids)))
+
+        def move(d):
+            target = targets.get(d['refid'])
+            if target is None:
+                return dict(d, status=404)
+            return dict(d, status=move_record(fedoraUrl, client, unit, d['dosid'], d['refid'], target=target))
+        return list(pool.map(move, dossiers))
+
+def write_results(results, filename=None):
+    """Per dossier report of a bulk action (dosid;refid;status), printed without filename"""
+    lines = ['dosid;refid;status']
+    for x in results:
+        lines.append('{dosid};{refid};{status}'.format(dosid=x['dosid'], refid=x['refid'] or '', status=x['status']))
+    if filename is None:
+        print('\n'.join(lines))
     else:
-        print('ERROR')
-        print(r.status_code)
-        print(r.text)
-    
-    headers = {"Content-Type": "text/turtle"}    
-    r = requests.put(recordUri, auth=auth, data=data2.encode('utf-8'), headers=headers)
-    return r.status_code
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
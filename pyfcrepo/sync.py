@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import json
+import hashlib
+import threading
+
+def turtle_hash(data):
+    """Hash of a rendered turtle, ignoring the premis:version label"""
+    lines = [l.strip() for l in data.split('\n') if 'premis:version' not in l]
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+class SyncState:
+    """Local state file mapping resource url -> hash of its last written turtle (and ETag).
+
+    The version label is left out of the hash: a node whose content did
+    not change between two referential versions is not rewritten, and
+    versioned reads of it are resolved through the version index.
+    """
+
+    def __init__(self, filename, client=None, verify=False):
+        self.filename = filename
+        self.client = client
+        self.verify = verify
+        self.lock = threading.Lock()
+        self.resources = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                self.resources = json.load(f)
+
+    def changed(self, url, data):
+        """True if url has to be written; with verify, also checks the server ETag"""
+        state = self.resources.get(url)
+        if state is None or state['hash'] != turtle_hash(data):
+            return True
+        if self.verify and self.client is not None:
+            r = self.client.head(url)
+            return r.status_code != 200 or r.headers.get('ETag') != state.get('etag')
+        return False
+
+    def update(self, url, data, r):
+        """Record a write, given its response"""
+        if r.status_code >= 400:
+            return
+        with self.lock:
+            self.resources[url] = {'hash': turtle_hash(data), 'etag': r.headers.get('ETag')}
+
+    def save(self):
+        d = os.path.dirname(self.filename)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        with self.lock:
+            tmp = self.filename + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.resources, f)
+            os.replace(tmp, self.filename)
+
+def open_sync(client, sync, verify=False):
+    """SyncState of the client state directory when sync is requested, else None"""
+    if not sync or client.state_dir is None:
+        return None
+    return SyncState(os.path.join(client.state_dir, 'sync.json'), client=client, verify=verify)
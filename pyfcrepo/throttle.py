@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import time
+import random
+import threading
+
+# statuses Fedora answers when overloaded or when a resource is busy
+RETRY_STATUSES = {409, 429, 500, 502, 503, 504}
+IDEMPOTENT = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+def backoff_delay(attempt, backoff=0.5, max_delay=30.0):
+    """Full-jitter exponential backoff before retry number attempt (1, 2, ...)"""
+    return random.uniform(0, min(max_delay, backoff * 2 ** (attempt - 1)))
+
+# longest Retry-After honoured (s)
+MAX_RETRY_AFTER = 60.0
+
+def retry_after(r, max_delay=MAX_RETRY_AFTER):
+    """Delay (s) asked by a Retry-After header in seconds, at most max_delay, or None"""
+    value = r.headers.get('Retry-After') if r is not None else None
+    if value is not None and value.isdigit():
+        return min(float(value), max_delay)
+    return None
+
+def retryable(r, kind):
+    """True if a retryable status is worth retrying for this request.
+
+    A 409 on a binary or on a request carrying a Digest is a permanent
+    conflict (e.g. a fixity mismatch): sending the body again cannot help.
+    Neither can committing a transaction again after a 409.
+    """
+    if r.status_code == 409:
+        return kind not in ('binary', 'transaction') and 'Digest' not in r.request.headers
+    return True
+
+class TokenBucket:
+    """Rate cap: at most rate requests per second, bursts of up to burst"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimit:
+    """AIMD limit on the number of requests in flight.
+
+    The limit starts at max_limit and is halved, at most once per window
+    (a window being limit requests), when a request fails with a retryable
+    status or a connection error, or when its latency exceeds
+    latency_factor times the lowest latency seen for requests of the same
+    class (e.g. method and resource kind: a PUT is not compared with a
+    GET). It then grows back by one per window of successful requests.
+    """
+
+    def __init__(self, min_limit=1, max_limit=10, latency_factor=3.0, decrease=0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_factor = latency_factor
+        self.decrease = decrease
+        self.limit = float(self.max_limit)
+        self.inflight = 0
+        self.baselines = {}
+        self.since_decrease = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.inflight >= int(self.limit):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, seconds, ok, key=None):
+        """Record a finished request of class key; key=None for requests slow by nature (binaries)"""
+        with self.cond:
+            self.inflight -= 1
+            self.since_decrease += 1
+            congested = not ok
+            if ok and key is not None:
+                baseline = self.baselines.get(key)
+                if baseline is None or seconds < baseline:
+                    baseline = seconds
+                else:
+                    # let the baseline follow a slowly drifting server
+                    baseline *= 1.001
+                self.baselines[key] = baseline
+                congested = seconds > self.latency_factor * baseline and seconds > 0.05
+            if congested:
+                if self.since_decrease >= int(self.limit):
+                    self.limit = max(self.min_limit, self.limit * self.decrease)
+                    self.since_decrease = 0
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
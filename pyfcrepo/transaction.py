@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import time
+import threading
+
+import requests
+
+from .throttle import backoff_delay
+
+class TransactionError(Exception):
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class Transaction:
+    """Fedora atomic transaction (fcr:tx) kept alive by a background thread.
+
+    Used as a context manager it commits on success and rolls back when
+    an exception escapes the block. Writes join the transaction by
+    sending its url as Atomic-ID header.
+    """
+
+    def __init__(self, client, keepalive=60):
+        self.client = client
+        self.keepalive = keepalive
+        self.url = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def begin(self):
+        """Open the transaction; POST fcr:tx is retried, since an unused transaction just expires"""
+        status = None
+        for attempt in range(self.client.retries + 1):
+            if attempt > 0:
+                time.sleep(backoff_delay(attempt, self.client.backoff))
+            try:
+                r = self.client.post(self.client.fedoraUrl + 'fcr:tx')
+            except (requests.ConnectionError, requests.Timeout):
+                # no response: reported as unavailable
+                status = 503
+                continue
+            status = r.status_code
+            if status == 201:
+                break
+        if status != 201:
+            raise TransactionError('Cannot begin transaction: {code}'.format(code=status), status=status)
+        self.url = r.headers['Location']
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def run(self):
+        while not self.stopped.wait(self.keepalive):
+            # a failed refresh must not end the keepalive: the next one may succeed before expiry
+            try:
+                status = self.refresh()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                status = e
+            if not isinstance(status, int) or status >= 400:
+                print('ERROR')
+                print('Cannot refresh transaction:', self.url, status)
+
+    def refresh(self):
+        return self.client.post(self.url).status_code
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def commit(self):
+        self.stop()
+        return self.client.put(self.url).status_code
+
+    def rollback(self):
+        self.stop()
+        return self.client.delete(self.url).status_code
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import os
+import re
+import json
+import threading
+import datetime
+import email.utils
+
+def memento2datetime(memento):
+    """Fedora memento id (YYYYMMDDhhmmss, UTC) to an aware datetime"""
+    return datetime.datetime.strptime(memento, '%Y%m%d%H%M%S').replace(tzinfo=datetime.timezone.utc)
+
+def datetime2memento(dt):
+    return dt.astimezone(datetime.timezone.utc).strftime('%Y%m%d%H%M%S')
+
+def http2memento(date):
+    """HTTP Date header to a memento id"""
+    return datetime2memento(email.utils.parsedate_to_datetime(date))
+
+def memento2http(memento):
+    """Memento id to an Accept-Datetime header value"""
+    return email.utils.format_datetime(memento2datetime(memento), usegmt=True)
+
+def url2unit(url):
+    m = re.search(r'/records/([^/]+)/', url)
+    if m is None:
+        return None
+    return m.group(1)
+
+class VersionIndex:
+    """Persistent mapping unit -> referential version label -> memento id.
+
+    The memento id is the time at which the version was complete; a node
+    read with Accept-Datetime set to it resolves to its memento for that
+    version, whether or not the node changed. With filename None the index
+    is only kept in memory.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.lock = threading.Lock()
+        # units rebuilt from the repository by this process, see referential.version_memento
+        self.rebuild_lock = threading.Lock()
+        self.rebuilt = set()
+        self.units = {}
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                self.units = json.load(f)
+
+    def lookup(self, unit, label):
+        return self.units.get(unit.lower(), {}).get(label)
+
+    def record(self, unit, label, memento):
+        with self.lock:
+            self.units.setdefault(unit.lower(), {})[label] = memento
+            self.save()
+
+    def replace(self, unit, labels):
+        with self.lock:
+            self.units[unit.lower()] = dict(labels)
+            self.save()
+
+    def save(self):
+        if self.filename is None:
+            return
+        d = os.path.dirname(self.filename)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.units, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.filename)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+from pyfcrepo import diff
+from pyfcrepo.referential import read_ref, REF_COLUMNS
+
+def write_ref(path, rows):
+    """Minimal referential CSV: (id, parent_id, callnr, title, protection) rows"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(';'.join(REF_COLUMNS) + '\n')
+        for i, parent, callnr, title, protection in rows:
+            values = dict.fromkeys(REF_COLUMNS, '')
+            values.update({'M1': i, 'M2': parent, 'M3': '="' + callnr + '"', 'M4': title,
+                           'M11_ExternalId': protection})
+            f.write(';'.join(str(values[c]) for c in REF_COLUMNS) + '\n')
+    return read_ref(path)
+
+OLD = [(0, '-', '-', '-', '-'),
+       (1, 0, 'A', 'Administration', 'P1'),
+       (2, 1, 'A.1', 'Budget', 'P1'),
+       (3, 0, 'B', 'Buildings', 'P1'),
+       (4, 3, 'B.1', 'Schools', 'P1'),
+       (6, 0, 'C', 'Culture', 'P1'),
+       (7, 0, 'D', 'Roads', 'P1')]
+
+NEW = [(0, '-', '-', '-', '-'),
+       (1, 0, 'A', 'Administration and finance', 'P1'),
+       (2, 3, 'A.1', 'Budget', 'P1'),
+       (3, 0, 'B', 'Buildings', 'P1'),
+       (5, 1, 'A.2', 'Taxes', 'P1'),
+       (6, 0, 'C', 'Culture', 'P1'),
+       (7, 0, 'D', 'Roads', 'P2')]
+
+def test_diff_ref_categories(tmp_path):
+    changes = diff.diff_ref(write_ref(tmp_path / 'old.csv', OLD), write_ref(tmp_path / 'new.csv', NEW))
+    assert changes['plan'] == {0: [diff.UNCHANGED],
+                               1: [diff.RENAMED, diff.CHILDREN],
+                               2: [diff.MOVED],
+                               3: [diff.CHILDREN],
+                               4: [diff.DELETED],
+                               5: [diff.CREATED],
+                               6: [diff.UNCHANGED],
+                               7: [diff.RULES]}
+    assert sorted(diff.to_write(changes)) == [1, 2, 3, 5, 7]
+    assert diff.to_close(changes) == [4]
+
+def test_diff_ref_identical(tmp_path):
+    df = write_ref(tmp_path / 'old.csv', OLD)
+    changes = diff.diff_ref(df, df)
+    assert all(c == [diff.UNCHANGED] for c in changes['plan'].values())
+    assert diff.to_write(changes) == []
+
+def test_plan2json_move(tmp_path):
+    changes = diff.diff_ref(write_ref(tmp_path / 'old.csv', OLD), write_ref(tmp_path / 'new.csv', NEW))
+    entries = {e['id']: e for e in diff.plan2json(changes)}
+    assert entries[2]['from'] == '1' and entries[2]['to'] == '3'
+    assert entries[4]['callnr'] == 'B.1'
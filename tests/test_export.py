@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import io
+import json
+
+from pyfcrepo import export
+from pyfcrepo.referential import read_ref
+
+BASE = 'http://localhost:8080/rest/'
+
+def node(i, parent, callnr, title, abstract='', rules=('protection1', 'closingPeriod10', 'retentionPeriod50A')):
+    md = {'url': BASE + 'records/acv/referential/' + str(i), 'title': title, 'callnr': callnr,
+          'version': '2.0.0', 'children': [], 'abstract': abstract,
+          'rules': [BASE + 'rules/' + r for r in rules]}
+    if parent is not None:
+        md['parent_id'] = BASE + 'records/acv/referential/' + str(parent)
+    return md
+
+# depth-first walk order: (depth, node)
+TREE = [(0, node(0, None, 'X', 'None', rules=())),
+        (1, node(1, 0, 'A', 'Administration', abstract='Finance; taxes')),
+        (2, node(2, 1, 'A.1', 'Budget "draft" 2022')),
+        (1, node(3, 0, 'B', 'Buildings'))]
+
+def write(fmt):
+    out = io.StringIO()
+    writer = export.FORMATS[fmt](out, version='2.0.0')
+    for depth, md in TREE:
+        writer.write(depth, md)
+    writer.close()
+    return out.getvalue()
+
+def test_node_rules():
+    assert export.node_rules(TREE[1][1]) == {'protection': '1', 'closingPeriod': '10', 'retentionPeriod': '50'}
+
+def test_csv_round_trip(tmp_path):
+    path = tmp_path / 'ref.csv'
+    path.write_text(write('csv'), encoding='utf-8')
+    df = read_ref(path)
+    rows = {r['id']: r for r in df.astype(str).to_dict('records')}
+    assert list(rows) == ['0', '1', '2', '3']
+    assert rows['0']['parent_id'] == '-'
+    assert rows['2']['parent_id'] == '1'
+    assert rows['2']['cote'] == 'A.1'
+    assert rows['2']['title'] == 'Budget "draft" 2022'
+    assert rows['1']['abstract'] == 'Finance; taxes'
+    assert rows['3']['protection'] == '1'
+    assert rows['3']['closingPeriod'] == '10'
+    assert rows['3']['retentionPeriod'] == '50'
+
+def test_json_nesting():
+    doc = json.loads(write('json'))
+    assert doc['id'] == '0'
+    assert [c['id'] for c in doc['children']] == ['1', '3']
+    assert [c['id'] for c in doc['children'][0]['children']] == ['2']
+    assert 'children' not in doc['children'][1]
+
+def test_ndjson_lines():
+    lines = [json.loads(l) for l in write('ndjson').splitlines()]
+    assert [(x['id'], x['depth'], x['parent_id']) for x in lines] == [('0', 0, '-'), ('1', 1, '0'), ('2', 2, '1'), ('3', 1, '0')]
+
+def test_html_lists():
+    html = write('html')
+    assert html.count('<li>') == 3
+    assert html.count('<ul') == html.count('</ul>')
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+import json
+
+from pyfcrepo.journal import Journal, payload_hash
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def read_lines_skipping_torn(path):
+    out = []
+    with open(path) as f:
+        for line in f:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                pass
+    return out
+
+def test_record_and_compact(tmp_path):
+    path = tmp_path / 'j.jsonl'
+    j = Journal(str(path))
+    j.record('A', 'h1', 201)
+    j.record('B', 'h1', 503)
+    j.compact()
+    j.close()
+    assert read_lines(path) == [{'url': 'A', 'hash': 'h1', 'status': 201}]
+
+def test_resume_torn_line(tmp_path):
+    path = tmp_path / 'j.jsonl'
+    with open(path, 'w') as f:
+        f.write(json.dumps({'url': 'A', 'hash': 'h1', 'status': 201}) + '\n')
+        f.write(json.dumps({'url': 'B', 'hash': 'h1', 'status': 201}) + '\n')
+        f.write(json.dumps({'url': 'C', 'hash': 'h1', 'status': 500}) + '\n')
+        f.write('{"url": "D", "ha')
+    j = Journal(str(path), resume=True)
+    assert j.done('A', 'h1')
+    assert not j.done('A', 'h2')
+    assert not j.done('C', 'h1')
+    assert not j.done('D', 'h1')
+    # written again with another payload, and a failed write retried
+    j.record('B', 'h2', 204)
+    j.record('C', 'h1', 201)
+    j.close()
+    # the torn line does not swallow the first line of the resumed run
+    assert {'url': 'B', 'hash': 'h2', 'status': 204} in read_lines_skipping_torn(path)
+
+    j = Journal(str(path), resume=True)
+    assert j.done('B', 'h2')
+    j.compact()
+    j.close()
+    assert sorted(read_lines(path), key=lambda e: e['url']) == [
+        {'url': 'A', 'hash': 'h1', 'status': 201},
+        {'url': 'B', 'hash': 'h2', 'status': 204},
+        {'url': 'C', 'hash': 'h1', 'status': 201}]
+
+def test_compact_resumed_rewritten(tmp_path):
+    path = tmp_path / 'j.jsonl'
+    j = Journal(str(path))
+    j.record('A', 'h1', 201)
+    j.record('B', 'h1', 201)
+    j.close()
+    j = Journal(str(path), resume=True)
+    j.record('A', 'h2', 204)
+    j.compact()
+    j.record('C', 'h1', 201)
+    j.close()
+    assert read_lines(path) == [{'url': 'B', 'hash': 'h1', 'status': 201},
+                                {'url': 'A', 'hash': 'h2', 'status': 204},
+                                {'url': 'C', 'hash': 'h1', 'status': 201}]
+
+def test_fresh_journal_starts_afresh(tmp_path):
+    path = tmp_path / 'j.jsonl'
+    j = Journal(str(path))
+    j.record('A', 'h1', 201)
+    j.close()
+    j = Journal(str(path))
+    assert not j.done('A', 'h1')
+    j.close()
+    assert read_lines(path) == []
+
+def test_payload_hash():
+    assert payload_hash('abc') == payload_hash(b'abc')
+    assert payload_hash('abc').startswith('sha-256=')
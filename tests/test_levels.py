@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+from pyfcrepo.referential import node_levels
+
+def test_node_levels_depth_order():
+    ids = [5, 0, 3, 1, 2, 4]
+    parents = {1: [0], 2: [1], 3: [0], 4: [3], 5: [2]}
+    assert node_levels(ids, parents) == [[0], [3, 1], [2, 4], [5]]
+
+def test_node_levels_unknown_parent_is_root():
+    # a parent missing from ids (e.g. an existing node) starts a level 0
+    assert node_levels([1, 2], {1: [99], 2: [1]}) == [[1], [2]]
+
+def test_node_levels_cycle():
+    levels = node_levels([1, 2], {1: [2], 2: [1]})
+    assert sorted(i for level in levels for i in level) == [1, 2]
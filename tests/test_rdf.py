@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of pyfcrepo.
+#
+# pyfcrepo is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# pyfcrepo is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with pyfcrepo. If not, see <https://www.gnu.org/licenses/>
+#
+# Author : Jan Krause-Bilvin
+# First release: 2022-03-03
+
+from pyfcrepo import rdf
+
+URL = 'http://localhost:8080/rest/records/acv/referential/1'
+
+NODE = '''<{url}> <{rico}title> "Caf\\u00E9 \\"Le Central\\""@fr .
+<{url}> <{rico}hasOrHadIdentifier> "A.1" .
+<{url}> <{premis}version> "2.0.0"^^<http://www.w3.org/2001/XMLSchema#string> .
+<{url}> <{rico}isOrWasPartOf> <http://localhost:8080/rest/records/acv/referential/0> .
+<{url}> <{rico}hasOrHadPart> <http://localhost:8080/rest/records/acv/referential/2> .
+<{url}> <{rico}hasOrHadPart> <http://localhost:8080/rest/records/acv/referential/3> .
+<{url}> <{rico}scopeAndContent> "line 1\\nline 2\\ttab" .
+<{url}> <{rico}isOrWasRegulatedBy> <http://localhost:8080/rest/rules/protection1> .
+<{url}> <http://purl.org/dc/elements/1.1/title> "not a RiC title" .
+# comment line
+'''.format(url=URL, rico=rdf.RICO, premis=rdf.PREMIS)
+
+def test_unescape():
+    assert rdf.unescape('a\\tb\\nc') == 'a\tb\nc'
+    assert rdf.unescape('\\"q\\" \\\\') == '"q" \\'
+    assert rdf.unescape('\\u00e9\\U0001F600') == 'é\U0001F600'
+
+def test_node_record():
+    md = rdf.node_record(NODE, URL)
+    assert md['url'] == URL
+    assert md['title'] == 'Café "Le Central"'
+    assert md['callnr'] == 'A.1'
+    assert md['version'] == '2.0.0'
+    assert md['parent_id'] == 'http://localhost:8080/rest/records/acv/referential/0'
+    assert md['children'] == ['http://localhost:8080/rest/records/acv/referential/2',
+                              'http://localhost:8080/rest/records/acv/referential/3']
+    assert md['abstract'] == 'line 1\nline 2\ttab'
+    assert md['rules'] == ['http://localhost:8080/rest/rules/protection1']
+
+def test_node_record_defaults():
+    md = rdf.node_record('', URL)
+    assert md == {'url': URL, 'title': 'None', 'callnr': 'X', 'version': 'None', 'children': []}
+
+def test_objects():
+    children = rdf.objects(NODE, rdf.RICO + 'hasOrHadPart')
+    assert children == ['http://localhost:8080/rest/records/acv/referential/2',
+                        'http://localhost:8080/rest/records/acv/referential/3']